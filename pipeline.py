@@ -0,0 +1,327 @@
+# %%
+"""
+Runs the survey scripts as one pipeline, rerunning only what is out of date.
+
+Every stage declares the files it reads and writes (glob patterns allowed).
+A stage reruns when the content hash of its inputs (including its own script
+and utils.py) differs from the one recorded after its last successful run, or
+when one of its outputs is missing. Stages whose inputs are produced by other
+stages wait for them; stages that do not depend on each other run in parallel.
+Because downstream stages hash the files upstream stages produce, an upstream
+rerun that writes identical outputs does not trigger anything else.
+
+Scripts and utils.py are hashed by their code only: comments, docstrings,
+formatting and line endings do not count as changes. Every script imports
+utils.py, and dependencies are not tracked per function, so a code change
+to any helper reruns every stage, including the ingestion of the whole log
+archive. Keep such changes for runs where that is acceptable.
+
+    python pipeline.py              # run what is out of date
+    python pipeline.py --dry-run    # only list it
+    python pipeline.py --force      # rerun everything
+"""
+
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LOGS = "../data/LogsBergenBelsen/Log_Survey*.json"  # Same as survey_processing.py
+HELPERS = ["utils.py"]  # Imported by every script
+
+STAGES = [
+    {
+        "name": "processing",
+        "script": "survey_processing.py",
+        "inputs": [
+            LOGS,
+            "english_questions.csv",
+            "mapping_questions.yaml",
+            "mapping_response.yaml",
+            "mapping_nationality.yaml",
+            "survey_schema.yaml",
+        ],
+        "outputs": [
+            "data/Log_Survey.csv",
+            "data/Log_Survey_Mapping_Hits.csv",
+            "data/Log_Survey_Translated.csv",
+            "data/Log_Survey_Processed.csv",
+            "data/Log_Survey.parquet",
+            "reports/unique_values_translated.html",
+        ],
+    },
+    {
+        "name": "personas",
+        "script": "survey_mapping.py",
+        "inputs": ["data/Log_Survey.parquet", "personas.yaml", "survey_schema.yaml"],
+        "outputs": ["data/Log_Survey_Persona.parquet"],
+    },
+    {
+        "name": "crosstab",
+        "script": "survey_crosstab.py",
+        "inputs": ["data/Log_Survey_Persona.parquet", "survey_schema.yaml"],
+        "outputs": ["data/Log_Survey_Crosstab.parquet"],
+    },
+    {
+        "name": "scoring",
+        "script": "survey_scoring.py",
+        "inputs": ["data/Log_Survey_Persona.parquet", "survey_schema.yaml"],
+        "outputs": ["data/Log_Survey_Scores.parquet", "data/Likert_Scale_Summary.csv"],
+    },
+    {
+        "name": "associations",
+        "script": "survey_associations.py",
+        "inputs": ["data/Log_Survey_Persona.parquet", "survey_schema.yaml"],
+        "outputs": [
+            "data/Profile_Associations.csv",
+            "reports/profile_associations.html",
+        ],
+    },
+    {
+        "name": "analysis",
+        "script": "survey_analysis.py",
+        "inputs": ["data/Log_Survey.parquet"],
+        "outputs": ["data/Log_Profile.csv", "panel6_survey_data_parquet.html"],
+    },
+    {
+        "name": "distributions",
+        "script": "survey_profiles_vis.py",
+        "inputs": [
+            "data/Log_Survey_Crosstab.parquet",
+            "data/Log_Survey_Persona.parquet",
+            "survey_schema.yaml",
+        ],
+        "outputs": ["reports/profile_distribution_report.html"],
+    },
+    {
+        "name": "demographics",
+        "script": "survey_profile_demographics.py",
+        "inputs": [
+            "data/Log_Survey_Crosstab.parquet",
+            "data/Log_Survey_Persona.parquet",
+            "survey_schema.yaml",
+        ],
+        "outputs": ["figures/*_demographics.png"],
+    },
+    {
+        "name": "interactions",
+        "script": "survey_interactions.py",
+        "inputs": [
+            "../data/LogsBergenBelsen/Log_*.json",
+            "interaction_logs.yaml",
+            "data/Log_Survey_Persona.parquet",
+            "survey_schema.yaml",
+        ],
+        "outputs": [
+            "data/Log_Interactions.parquet",
+            "data/Log_Survey_Interactions.parquet",
+        ],
+    },
+    {
+        "name": "static_profiles",
+        "script": "survey_static_profiles.py",
+        "inputs": [
+            "personas.yaml",
+            "reports/unique_values_translated.html",
+            "reports/profile_associations.html",
+        ],
+        "outputs": ["reports/persona_mapping.html", "combined_tabs.html"],
+    },
+]
+
+
+def _expand(patterns):
+    """Files matching the patterns, sorted so the fingerprint is stable."""
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+
+def file_digest(path, digests):
+    """
+    sha256 of a file's content. `digests` maps paths to (size, mtime, digest)
+    from earlier runs, so unchanged files are not read again.
+    """
+    stat = os.stat(path)
+    cached = digests.get(path)
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digests[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digests[path][2]
+
+
+def code_digest(path, digests):
+    """
+    sha256 of a Python module's syntax tree without docstrings, so only
+    changes to the code count. Cached in `digests` like file_digest.
+    """
+    stat = os.stat(path)
+    key = f"{path}:code"
+    cached = digests.get(key)
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cached[2]
+
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef))
+            and node.body
+            and isinstance(node.body[0], ast.Expr)
+            and isinstance(node.body[0].value, ast.Constant)
+            and isinstance(node.body[0].value.value, str)
+        ):
+            node.body = node.body[1:] or [ast.Pass()]
+    # ast.dump leaves out positions, so formatting does not matter either
+    digest = hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+    digests[key] = [stat.st_size, stat.st_mtime_ns, digest]
+    return digest
+
+
+def stage_fingerprint(stage, digests):
+    """One hash over the names and contents of all the inputs of a stage."""
+    fingerprint = hashlib.sha256()
+    for path in _expand(stage["inputs"]):
+        fingerprint.update(path.encode())
+        fingerprint.update(file_digest(path, digests).encode())
+    for path in [stage["script"], *HELPERS]:
+        fingerprint.update(path.encode())
+        fingerprint.update(code_digest(path, digests).encode())
+    return fingerprint.hexdigest()
+
+
+def _outputs_missing(stage):
+    return any(not glob.glob(pattern) for pattern in stage["outputs"])
+
+
+def _dependencies(stages):
+    """Stages whose outputs each stage reads, matched by declared pattern."""
+    producers = {
+        output: stage["name"] for stage in stages for output in stage["outputs"]
+    }
+    return {
+        stage["name"]: {
+            producers[path]
+            for path in stage["inputs"]
+            if path in producers and producers[path] != stage["name"]
+        }
+        for stage in stages
+    }
+
+
+def _run_script(stage):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, stage["script"]], capture_output=True, text=True
+    )
+    return result, time.perf_counter() - start
+
+
+def run_pipeline(
+    stages=STAGES,
+    state_path="data/pipeline_state.json",
+    max_workers=None,
+    force=False,
+    dry_run=False,
+):
+    """
+    Runs the out of date stages, in dependency order and in parallel where
+    possible, and records the input fingerprint of each successful stage.
+
+    Returns:
+        dict: Stage name -> "ran", "skipped", "failed", "blocked" (an upstream
+        stage failed) or "pending" (dry run).
+    """
+    state = {"stages": {}, "digests": {}}
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    digests = state["digests"]
+
+    by_name = {stage["name"]: stage for stage in stages}
+    dependencies = _dependencies(stages)
+    status = {}
+    # In a dry run, assume every out of date stage changes its outputs
+    assumed_changed = set()
+
+    def settle():
+        """Decides the stages whose dependencies are all done; returns those to run."""
+        to_run = []
+        finished = {name for name, value in status.items() if value != "running"}
+        for name, stage in by_name.items():
+            if name in status or not dependencies[name] <= finished:
+                continue
+            if {status[d] for d in dependencies[name]} & {"failed", "blocked"}:
+                status[name] = "blocked"
+                continue
+            fingerprint = stage_fingerprint(stage, digests)
+            up_to_date = (
+                not force
+                and state["stages"].get(name) == fingerprint
+                and not _outputs_missing(stage)
+                and not dependencies[name] & assumed_changed
+            )
+            if up_to_date:
+                status[name] = "skipped"
+            elif dry_run:
+                status[name] = "pending"
+                assumed_changed.add(name)
+            else:
+                status[name] = "running"
+                to_run.append((stage, fingerprint))
+        return to_run
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while True:
+            # Skipping a stage can unblock others, so settle until stable
+            while True:
+                before = len(status)
+                for stage, fingerprint in settle():
+                    running[executor.submit(_run_script, stage)] = (stage, fingerprint)
+                if len(status) == before:
+                    break
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                result, elapsed = future.result()
+                if result.returncode == 0:
+                    status[stage["name"]] = "ran"
+                    state["stages"][stage["name"]] = fingerprint
+                    print(f"{stage['name']}: ran in {elapsed:.1f} s")
+                else:
+                    status[stage["name"]] = "failed"
+                    print(f"{stage['name']}: failed\n{result.stderr}")
+
+    for name in by_name:
+        if status[name] != "ran":
+            print(f"{name}: {status[name]}")
+
+    if not dry_run:
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+    return status
+
+
+# %%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--force", action="store_true", help="rerun every stage")
+    parser.add_argument("--dry-run", action="store_true", help="only list stages")
+    parser.add_argument("--jobs", type=int, default=None, help="parallel stages")
+    args = parser.parse_args()
+
+    status = run_pipeline(max_workers=args.jobs, force=args.force, dry_run=args.dry_run)
+    sys.exit(1 if {"failed", "blocked"} & set(status.values()) else 0)
@@ -1,7 +1,7 @@
 # %%
-import pandas as pd
-# df_survey = pd.read_csv("data/Log_Survey_Processed.csv", index_col=0)
-df_survey = pd.read_parquet("data/Log_Survey.parquet")
+from utils import load_survey_parquet
+
+df_survey = load_survey_parquet("data/Log_Survey.parquet")
 
 # %% 
 selected_columns = [
@@ -0,0 +1,42 @@
+# %%
+from pathlib import Path
+
+from survey_crosstab import crosstab_questions
+from utils import (
+    load_survey_parquet,
+    load_yaml,
+    profile_association_table,
+    render_association_table_html,
+)
+
+
+def rank_associations(
+    survey_path, output_directory, reports_dir, schema_path="survey_schema.yaml"
+):
+    """
+    Log_Survey_Persona.parquet -> Profile_Associations.csv and its ranked
+    table, a tab of the combined report (survey_static_profiles.py).
+    """
+    df_survey = load_survey_parquet(survey_path)
+    # Same questions as the crosstab cube (survey_crosstab.py)
+    question_columns = crosstab_questions(load_yaml(schema_path)["schema"], df_survey)
+
+    # Chi-square of every question (multiselect: every option) vs profile
+    df_associations = profile_association_table(df_survey, question_columns)
+    df_associations.to_csv(
+        Path(output_directory) / "Profile_Associations.csv", index=False
+    )
+    render_association_table_html(
+        df_associations, Path(reports_dir) / "profile_associations.html"
+    )
+    return df_associations
+
+
+# %%
+if __name__ == "__main__":
+    df_associations = rank_associations(
+        "data/Log_Survey_Persona.parquet", "data/", "reports/"
+    )
+    print(df_associations.head(15).round(4).to_string(index=False))
+
+# %%
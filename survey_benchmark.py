@@ -0,0 +1,125 @@
+# %%
+import json
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+from utils import (
+    extract_id_files,
+    load_json_files,
+    load_json_files_parallel,
+    load_yaml,
+    normalize_responses,
+)
+
+questions = pd.read_csv("english_questions.csv")["question"]
+
+answer_pool = [
+    "Deutsch",
+    "german",
+    "Weiblich",
+    "25-34",
+    "Ja",
+    "3.Unentschieden",
+    "4.Zustimmen",
+    "Um mehr über die Geschichte zu erfahren_Zum Gedenken",
+    "",
+]
+
+
+def make_synthetic_logs(data_dir, n_files, seed=0):
+    """Writes n_files survey logs shaped like Log_Survey_BB_<id>.json."""
+    rng = random.Random(seed)
+    for i in range(n_files):
+        survey = [{"question": q, "answer": rng.choice(answer_pool)} for q in questions]
+        path = os.path.join(data_dir, f"Log_Survey_BB_{1730000000000 + i}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(survey, f)
+
+
+def load_serial(data_dir, pattern):
+    """Current path in survey_processing.py."""
+    survey = load_json_files(data_dir, pattern)
+    visitor_ids = extract_id_files(data_dir, pattern)
+    survey_tables = [pd.json_normalize(s, sep="_") for s in survey]
+    df_survey = pd.DataFrame(
+        {f"df_{i}": df["answer"] for i, df in enumerate(survey_tables)}
+    )
+    df_survey.columns = visitor_ids
+    df_survey.index = questions
+    return df_survey.T
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    table = result[0] if isinstance(result, tuple) else result
+    print(f"{label:<28} {elapsed:8.3f} s  {table.shape}")
+    return result
+
+
+# %%
+########### JSON loading: serial vs parallel
+if __name__ == "__main__":
+    n_files = 5000
+    pattern = "Log_Survey*.json"
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        make_synthetic_logs(data_dir, n_files)
+        print(f"{n_files} synthetic survey logs")
+
+        serial = timed("serial + json_normalize", load_serial, data_dir, pattern)
+        for workers in (1, 4, os.cpu_count()):
+            threads = timed(
+                f"threads ({workers} workers)",
+                load_json_files_parallel,
+                data_dir,
+                pattern,
+                questions,
+                max_workers=workers,
+            )
+            processes = timed(
+                f"processes ({workers} workers)",
+                load_json_files_parallel,
+                data_dir,
+                pattern,
+                questions,
+                max_workers=workers,
+                use_processes=True,
+            )
+
+        # Same answers under the same IDs
+        pd.testing.assert_frame_equal(
+            serial.set_axis(threads.columns, axis=1).sort_index(),
+            threads.sort_index(),
+            check_dtype=False,
+        )
+        pd.testing.assert_frame_equal(threads, processes)
+
+# %%
+########### Response normalization: df.replace vs normalize_responses
+if __name__ == "__main__":
+    n_copies = 100
+
+    mapping_response = load_yaml("mapping_response.yaml")["mapping_response"]
+    df_survey = pd.read_csv("data/Log_Survey.csv", index_col=0)
+    df_large = pd.concat([df_survey] * n_copies, ignore_index=True)
+    print(f"{len(df_large)} rows ({n_copies} x Log_Survey.csv)")
+
+    replaced = timed("df.replace", df_large.replace, mapping_response)
+    normalized, mapping_hits = timed(
+        "normalize_responses", normalize_responses, df_large, mapping_response
+    )
+
+    # Same cells missing, same values elsewhere
+    assert replaced.isna().equals(normalized.isna())
+    assert (
+        replaced[replaced.notna()]
+        .astype(str)
+        .equals(normalized[normalized.notna()].astype(str))
+    )
+
+# %%
@@ -0,0 +1,356 @@
+"""
+Command-line entry point for the survey processing stages.
+
+Runs the named stages in order, each in a process of its own, with
+configurable input and output paths, and writes the wall time, peak memory
+and row counts of every stage to a JSON metrics file. Stages read what earlier stages wrote, so any
+subset can be run on its own. Every stage calls the function the matching
+script runs (survey_processing.py, survey_mapping.py, ...), so the CLI, the
+scripts and pipeline.py write the same outputs.
+
+    python survey_cli.py                                # every stage
+    python survey_cli.py classify report figures        # only these
+    python survey_cli.py --logs-dir /archive/logs --metrics nightly.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import survey_associations
+import survey_crosstab
+import survey_interactions
+import survey_mapping
+import survey_processing
+import survey_profile_demographics
+import survey_profiles_vis
+import survey_scoring
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _read_table(path):
+    """A survey CSV written by an earlier stage, indexed by visitor ID."""
+    table = pd.read_csv(path, index_col=0, dtype=str)
+    return table.set_axis(table.index.astype(str))
+
+
+def ingest(args, context):
+    """JSON logs -> Log_Survey.csv (incremental unless --full)."""
+    df_survey, changes = survey_processing.ingest(
+        args.logs_dir,
+        args.pattern,
+        args.data_dir,
+        args.config_dir,
+        force=args.full,
+        max_workers=args.workers,
+    )
+    context["changes"] = changes
+    return {
+        "rows": len(df_survey),
+        **{kind: len(ids) for kind, ids in changes.items() if kind != "rebuilt"},
+        "rebuilt": changes["rebuilt"],
+    }
+
+
+def translate(args, context):
+    """Log_Survey.csv -> Log_Survey_Translated.csv and its unique values report."""
+    df_translated, mapping_hits = survey_processing.translate(
+        _read_table(args.data_dir / "Log_Survey.csv"),
+        args.data_dir,
+        args.config_dir,
+        args.reports_dir,
+    )
+    return {
+        "rows": len(df_translated),
+        "mapped_cells": int(mapping_hits["cells"].sum()),
+    }
+
+
+def purge(args, context):
+    """Test submissions -> Log_Survey_test_quarantine.csv (--delete-tests: delete)."""
+    quarantine = survey_processing.purge_tests(
+        _read_table(args.data_dir / "Log_Survey_Translated.csv"),
+        args.logs_dir,
+        args.pattern,
+        args.data_dir,
+        dry_run=not args.delete_tests,
+    )
+    return {
+        "test_submissions": quarantine["id"].nunique(),
+        "files": int(quarantine["path"].notna().sum()),
+    }
+
+
+def dedup(args, context):
+    """Translated table -> Log_Survey_Processed.csv and the typed Log_Survey.parquet."""
+    df_translated = _read_table(args.data_dir / "Log_Survey_Translated.csv")
+
+    # Without this run's ingest, or after a rebuild, every visitor is checked again
+    changes = context.get("changes")
+    recheck_ids = None
+    if changes and not changes["rebuilt"]:
+        recheck_ids = changes["changed"]
+
+    df_unique, hash_index = survey_processing.deduplicate(
+        df_translated, args.data_dir, args.config_dir, recheck_ids=recheck_ids
+    )
+    survey_processing.write_typed_table(df_unique, args.data_dir, args.config_dir)
+    return {"rows": len(df_translated), **hash_index["status"].value_counts().to_dict()}
+
+
+def classify(args, context):
+    """Typed table -> Log_Survey_Persona.parquet and Log_Survey_Crosstab.parquet."""
+    df_profile = survey_mapping.classify_visitors(
+        args.data_dir / "Log_Survey.parquet",
+        args.data_dir / "Log_Survey_Persona.parquet",
+        args.config_dir / "personas.yaml",
+        args.config_dir / "survey_schema.yaml",
+    )
+    df_cube = survey_crosstab.build_cube(
+        args.data_dir / "Log_Survey_Persona.parquet",
+        args.data_dir / "Log_Survey_Crosstab.parquet",
+        args.config_dir / "survey_schema.yaml",
+        max_workers=args.workers,
+    )
+    return {
+        "rows": len(df_profile),
+        **df_profile["profile"].value_counts().to_dict(),
+        "cube_rows": len(df_cube),
+    }
+
+
+def scoring(args, context):
+    """Persona table -> Log_Survey_Scores.parquet and Likert_Scale_Summary.csv."""
+    df_scores, df_summary = survey_scoring.score_likert_scales(
+        args.data_dir / "Log_Survey_Persona.parquet",
+        args.data_dir,
+        args.config_dir / "survey_schema.yaml",
+    )
+    return {"rows": len(df_scores), "scales": df_scores.shape[1]}
+
+
+def associations(args, context):
+    """Persona table -> Profile_Associations.csv and profile_associations.html."""
+    df_associations = survey_associations.rank_associations(
+        args.data_dir / "Log_Survey_Persona.parquet",
+        args.data_dir,
+        args.reports_dir,
+        args.config_dir / "survey_schema.yaml",
+    )
+    return {
+        "tests": len(df_associations),
+        "significant": int((df_associations["p_adjusted"] < 0.05).sum()),
+    }
+
+
+def interactions(args, context):
+    """Interaction logs -> per-visitor aggregates, joined to the persona table."""
+    df_interactions, df_joined = survey_interactions.aggregate_visitor_interactions(
+        args.logs_dir,
+        args.data_dir,
+        args.config_dir / "interaction_logs.yaml",
+        args.config_dir / "survey_schema.yaml",
+    )
+    return {
+        "visitors": len(df_interactions),
+        "rows": len(df_joined),
+        "joined": int(df_joined["events"].notna().sum()),
+    }
+
+
+def report(args, context):
+    """Crosstab cube -> profile_distribution_report.html."""
+    df_cube, questions = survey_profiles_vis.export_distribution_report(
+        args.data_dir / "Log_Survey_Crosstab.parquet",
+        args.reports_dir / "profile_distribution_report.html",
+        args.config_dir / "survey_schema.yaml",
+    )
+    return {"rows": len(df_cube), "figures": len(questions)}
+
+
+def figures(args, context):
+    """Crosstab cube -> one demographics PNG per profile."""
+    rendered, skipped = survey_profile_demographics.render_demographics(
+        args.data_dir / "Log_Survey_Crosstab.parquet",
+        args.figures_dir,
+        args.config_dir / "survey_schema.yaml",
+        max_workers=args.workers,
+    )
+    return {"rendered": rendered, "skipped": skipped}
+
+
+STAGES = {
+    "ingest": ingest,
+    "translate": translate,
+    "purge": purge,
+    "dedup": dedup,
+    "classify": classify,
+    "scoring": scoring,
+    "associations": associations,
+    "interactions": interactions,
+    "report": report,
+    "figures": figures,
+}
+
+
+def _peak_rss_mb(children=False):
+    """
+    Peak resident memory of this process, or of the largest of its finished
+    child processes (None where unsupported).
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _stage_process(name, args, context, connection):
+    """Runs one stage in the current (fresh) process and sends back its metrics."""
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        counts = STAGES[name](args, context)
+        error = None
+    except Exception as exc:
+        traceback.print_exc()
+        counts = {}
+        error = f"{type(exc).__name__}: {exc}"
+    metrics = {
+        "stage": name,
+        "wall_time_s": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        # Pools of the stage (figures, resampling): the largest worker
+        "workers_peak_rss_mb": _peak_rss_mb(children=True),
+    }
+    if args.trace_memory:
+        metrics["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    metrics["counts"] = counts
+    if error:
+        metrics["error"] = error
+    connection.send((metrics, context))
+    connection.close()
+
+
+def run_stage(name, args, context):
+    """
+    Runs one stage in a child process and returns its metrics.
+
+    The peak resident memory of a process only ever grows, so a stage run in
+    the CLI's own process would report the peak of the hungriest stage before
+    it. A fresh process per stage makes every peak the stage's own; stages
+    share nothing but files and the small `context` (e.g. the ingest changes).
+    """
+    start = time.perf_counter()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_stage_process, args=(name, args, context, sender)
+    )
+    process.start()
+    sender.close()
+    try:
+        metrics, stage_context = receiver.recv()
+        context.update(stage_context)
+    except EOFError:  # Killed before reporting (e.g. out of memory)
+        metrics = {
+            "stage": name,
+            "wall_time_s": round(time.perf_counter() - start, 3),
+            "counts": {},
+        }
+    process.join()
+    if process.exitcode:
+        metrics.setdefault(
+            "error", f"stage process exited with code {process.exitcode}"
+        )
+    return metrics
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        metavar="stage",
+        help=f"stages to run, any of: {', '.join(STAGES)} (default: all)",
+    )
+    paths = [
+        ("--logs-dir", "../data/LogsBergenBelsen", "survey JSON logs"),
+        ("--config-dir", ".", "YAML mappings and english_questions.csv"),
+        ("--data-dir", "data", "tables, indexes and caches"),
+        ("--reports-dir", "reports", "HTML reports"),
+        ("--figures-dir", "figures", "PNG figures"),
+        ("--metrics", "data/metrics.json", "JSON metrics file"),
+    ]
+    for flag, default, what in paths:
+        parser.add_argument(
+            flag,
+            type=Path,
+            default=Path(default),
+            help=f"{what} (default: %(default)s)",
+        )
+    parser.add_argument(
+        "--pattern", default="Log_Survey*.json", help="log filename pattern"
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="parse every log instead of only new ones"
+    )
+    parser.add_argument(
+        "--delete-tests",
+        action="store_true",
+        help="delete the logs of test submissions (default: only list them)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="pool size")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also record the peak of Python allocations per stage (slower)",
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    args.stages = args.stages or list(STAGES)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for directory in (args.data_dir, args.reports_dir, args.figures_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    run = {"started": datetime.now().isoformat(timespec="seconds"), "stages": []}
+    context = {}
+    start = time.perf_counter()
+    # Always in pipeline order, whatever order they were given in
+    for name in [stage for stage in STAGES if stage in args.stages]:
+        metrics = run_stage(name, args, context)
+        run["stages"].append(metrics)
+        print(f"[{name}] {metrics['wall_time_s']:.2f} s  {metrics['counts']}")
+        if "error" in metrics:
+            print(f"[{name}] failed: {metrics['error']}")
+            break
+    run["wall_time_s"] = round(time.perf_counter() - start, 3)
+
+    args.metrics.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.metrics, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2, default=str)
+    print(f"Metrics saved to: {args.metrics}")
+    return 1 if any("error" in m for m in run["stages"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
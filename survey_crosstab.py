@@ -0,0 +1,63 @@
+# %%
+from utils import (
+    build_crosstab_cube,
+    load_survey_parquet,
+    load_yaml,
+    resample_crosstab,
+)
+
+
+def crosstab_questions(survey_schema, df_survey):
+    """Every answered question except free text and the profile assignments."""
+    return [
+        col
+        for col, spec in survey_schema.items()
+        if spec["type"] != "text"
+        and col not in ("profile", "profile_soft")
+        and col in df_survey.columns
+    ]
+
+
+def build_cube(
+    survey_path,
+    output_path,
+    schema_path="survey_schema.yaml",
+    n_resamples=10_000,
+    max_workers=1,
+):
+    """
+    Log_Survey_Persona.parquet -> Log_Survey_Crosstab.parquet: counts and
+    within-profile percentages of every (question, option, profile), read by
+    the Dash app, the HTML report and the demographic figures.
+    """
+    df_survey = load_survey_parquet(survey_path)
+    question_columns = crosstab_questions(load_yaml(schema_path)["schema"], df_survey)
+    df_cube = build_crosstab_cube(df_survey, question_columns, profile_column="profile")
+
+    # Bootstrap intervals and permutation p-values of every percentage
+    df_cube = df_cube.merge(
+        resample_crosstab(
+            df_survey,
+            question_columns,
+            n_resamples=n_resamples,
+            seed=0,
+            max_workers=max_workers,
+        ),
+        on=["question", "option", "profile"],
+        how="left",
+    )
+    df_cube.to_parquet(output_path, index=False)
+    print(
+        f"Crosstab cube: {df_cube['question'].nunique()} questions, "
+        f"{df_cube['profile'].nunique()} profiles, {len(df_cube)} rows"
+    )
+    return df_cube
+
+
+# %%
+if __name__ == "__main__":
+    df_cube = build_cube(
+        "data/Log_Survey_Persona.parquet", "data/Log_Survey_Crosstab.parquet"
+    )
+
+# %%
@@ -0,0 +1,71 @@
+# %%
+from pathlib import Path
+
+from utils import (
+    aggregate_interactions,
+    index_log_files,
+    join_interactions,
+    load_survey_parquet,
+    load_yaml,
+    write_survey_parquet,
+)
+
+
+def aggregate_visitor_interactions(
+    data_dir,
+    output_directory,
+    config_path="interaction_logs.yaml",
+    schema_path="survey_schema.yaml",
+):
+    """
+    Interaction logs -> Log_Interactions.parquet (per-visitor aggregates) and
+    Log_Survey_Interactions.parquet (survey answers and profiles joined with
+    them).
+    """
+    output_directory = Path(output_directory)
+    config = load_yaml(config_path)
+
+    # One listing of every log type, by visitor ID
+    log_index = index_log_files(data_dir, config["pattern"])
+    print(log_index.groupby("log_type")["size"].agg(["count", "sum"]))
+
+    interaction_types = sorted(
+        set(log_index["log_type"]) - set(config["survey_log_types"])
+    )
+
+    # Per-visitor aggregates, streamed one batch of events at a time
+    # The checkpoint keeps the aggregate of every finished log: an interrupted
+    # run resumes, and later runs only read new or changed logs
+    df_interactions = aggregate_interactions(
+        log_index,
+        interaction_types,
+        config["fields"],
+        unit=config["timestamp_unit"],
+        events_key=config["events_key"],
+        checkpoint_path=output_directory / "Log_Interactions_checkpoint.jsonl",
+    )
+    df_interactions.to_parquet(output_directory / "Log_Interactions.parquet")
+
+    # Survey answers and profiles with the interaction aggregates
+    df_survey = load_survey_parquet(output_directory / "Log_Survey_Persona.parquet")
+    df_joined = join_interactions(df_survey, df_interactions)
+    print(
+        f"{df_joined['events'].notna().sum()} of {len(df_joined)} surveyed visitors "
+        "have interaction logs"
+    )
+
+    survey_schema = load_yaml(schema_path)["schema"]
+    write_survey_parquet(
+        df_joined, output_directory / "Log_Survey_Interactions.parquet", survey_schema
+    )
+    return df_interactions, df_joined
+
+
+# %%
+if __name__ == "__main__":
+    # Same directory as the survey logs
+    df_interactions, df_joined = aggregate_visitor_interactions(
+        Path("../data/LogsBergenBelsen"), Path("data/")
+    )
+
+# %%
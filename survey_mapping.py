@@ -1,16 +1,49 @@
 # %%
-import pandas as pd
+from utils import (
+    compile_persona_rules,
+    load_survey_parquet,
+    load_yaml,
+    persona_similarity,
+    visitor_profile,
+    write_survey_parquet,
+)
 
-# df_survey = pd.read_parquet("data/Log_Survey.parquet")
-df_survey = pd.read_csv("data/Log_Survey_Processed.csv", index_col=0)
 
-# %%
-from utils import visitor_profile
+def classify_visitors(
+    survey_path,
+    output_path,
+    personas_path="personas.yaml",
+    schema_path="survey_schema.yaml",
+):
+    """Typed table -> Log_Survey_Persona.parquet with hard and soft profiles."""
+    df_survey = load_survey_parquet(survey_path)
+
+    # Map visitors to static profiles using the rules in personas.yaml
+    ## Student - visit_type
+    ## Personal Involvement - personal_connection
+    ## Researcher - visit_purpose,educational_level
+    ## Tourist - everyone else (default)
+    df_profile = visitor_profile(df_survey, personas_path)
+    df_profile["profile"] = df_profile["profile"].astype("category")
+
+    # Soft assignment: cosine similarity of each visitor's answers to every persona
+    persona_rules = compile_persona_rules(load_yaml(personas_path))
+    persona_scores = persona_similarity(df_profile, persona_rules)
+    df_profile["profile_soft"] = (
+        persona_scores.idxmax(axis=1)
+        .where(persona_scores.max(axis=1) > 0)  # No overlap with any persona
+        .astype("category")
+    )
+    df_profile = df_profile.join(persona_scores.add_prefix("score_"))
+
+    survey_schema = load_yaml(schema_path)["schema"]
+    write_survey_parquet(df_profile, output_path, survey_schema)
+    return df_profile
 
-# Map visitors to static profiles using mapping
-## Student - visit_type
-## Personal Involvement - personal_connection
-## Researcher - visit_purpose,educational_level
-## Tourist - no personal_connection
-df_profile = visitor_profile(df_survey)
-df_profile.to_csv("data/Log_Survey_Persona.csv")
+
+# %%
+if __name__ == "__main__":
+    df_profile = classify_visitors(
+        "data/Log_Survey.parquet", "data/Log_Survey_Persona.parquet"
+    )
+# %%
@@ -5,33 +5,56 @@ from pathlib import Path
 import pandas as pd
 
 sys.path.append("..")
-from utils import extract_id_files, load_json_files, load_yaml
+from utils import ingest_surveys_incremental, load_yaml
 
-# %%
-########### Load and Process
+# Each step is a function of its input and output directories, shared with
+# survey_cli.py; the cells below run them with these settings
 data_dir = Path("../data/LogsBergenBelsen")
 pattern = "Log_Survey*.json"  # Survey files pattern
 output_directory = Path("data/")
-output_filename = "Log_Survey.csv"
-
-# Load JSONs into Pandas df
-survey = load_json_files(data_dir, pattern)
-visitor_ids = extract_id_files(data_dir, pattern)
-survey_tables = [pd.json_normalize(s, sep="_") for s in survey]
-df_survey = pd.DataFrame(
-    {f"df_{i}": df["answer"] for i, df in enumerate(survey_tables)}
-)
+reports_directory = Path("reports/")
+config_directory = Path(".")  # english_questions.csv and the YAML mappings
+incremental = True  # Only parse files added or changed since the last run
+max_workers = None  # Loader pool size (None: executor default)
+
+
+# %%
+########### Load and Process
+def ingest(
+    data_dir,
+    pattern,
+    output_directory,
+    config_dir=Path("."),
+    force=False,
+    max_workers=None,
+):
+    """JSON logs -> Log_Survey.csv, only new or changed files unless force."""
+    questions = pd.read_csv(config_dir / "english_questions.csv")["question"]
+    mapping_questions = load_yaml(config_dir / "mapping_questions.yaml")[
+        "mapping_questions"
+    ]
+    # A full rebuild (force) also rewrites the manifest
+    return ingest_surveys_incremental(
+        data_dir,
+        pattern,
+        output_directory / "Log_Survey.csv",
+        output_directory / "Log_Survey_manifest.json",
+        questions,
+        columns=questions.map(mapping_questions),
+        force=force,
+        max_workers=max_workers,
+    )
 
-df_survey.columns = visitor_ids
-questions = pd.read_csv("english_questions.csv")["question"]
-df_survey.index = questions  # English questions
-# Save
-df_survey = df_survey.T
 
-# Rename columns
-mapping_questions = load_yaml("mapping_questions.yaml")["mapping_questions"]
-df_survey.columns = df_survey.columns.map(mapping_questions)
-df_survey.to_csv(output_directory / output_filename)
+if __name__ == "__main__":
+    df_survey, changes = ingest(
+        data_dir,
+        pattern,
+        output_directory,
+        config_directory,
+        force=not incremental,
+        max_workers=max_workers,
+    )
 
 # %%
 ########### Report unique elements per column
@@ -41,39 +64,142 @@ from utils import (
     render_mapping_dict_to_html,
 )
 
-mapping_response = load_yaml("mapping_response.yaml")["mapping_response"]
-# generate_columnwise_unique_report(df_survey, output_path="reports/unique_values.html")
-# render_mapping_dict_to_html(mapping_response, output_path="reports/mapping_report.html")
+if __name__ == "__main__":
+    mapping_response = load_yaml("mapping_response.yaml")["mapping_response"]
+    # generate_columnwise_unique_report(df_survey, output_path="reports/unique_values.html")
+    # render_mapping_dict_to_html(mapping_response, output_path="reports/mapping_report.html")
 
 # %%
 ########### Normalize and Translate
-mapping_response = load_yaml("mapping_response.yaml")["mapping_response"]
-df_survey_translated = df_survey.replace(mapping_response)
-df_survey_translated.to_csv(output_directory / "Log_Survey_Translated.csv")
+from utils import build_nationality_index, canonicalize_nationality, normalize_responses
+
+
+def translate(
+    df_survey, output_directory, config_dir=Path("."), reports_dir=Path("reports")
+):
+    """Survey table -> Log_Survey_Translated.csv and its unique values report."""
+    mapping_response = load_yaml(config_dir / "mapping_response.yaml")[
+        "mapping_response"
+    ]
+    df_survey_translated, mapping_hits = normalize_responses(
+        df_survey, mapping_response
+    )
+    mapping_hits.to_csv(output_directory / "Log_Survey_Mapping_Hits.csv", index=False)
+
+    # Nationality: case/whitespace folding, then fuzzy match of unseen spellings
+    nationality_config = load_yaml(config_dir / "mapping_nationality.yaml")
+    nationality_index = build_nationality_index(
+        mapping_response,
+        nationality_config["canonical_nationalities"],
+        nationality_config["special_values"],
+        nationality_config["aliases"],
+    )
+    df_survey_translated["nationality"], nationality_resolutions = (
+        canonicalize_nationality(
+            df_survey_translated["nationality"],
+            nationality_index,
+            cache_path=output_directory / "Log_Survey_nationality_cache.json",
+        )
+    )
+    df_survey_translated.to_csv(output_directory / "Log_Survey_Translated.csv")
+
+    generate_columnwise_unique_report(
+        df_survey_translated,
+        output_path=reports_dir / "unique_values_translated.html",
+    )
+    return df_survey_translated, mapping_hits
 
-generate_columnwise_unique_report(
-    df_survey_translated, output_path="reports/unique_values_translated.html"
-)
+
+if __name__ == "__main__":
+    df_survey_translated, mapping_hits = translate(
+        df_survey, output_directory, config_directory, reports_directory
+    )
+
+# %%
+########## Test entries (mapped to "Test" above)
+from utils import purge_test_submissions
+
+
+def purge_tests(
+    df_survey_translated, data_dir, pattern, output_directory, dry_run=True
+):
+    """Test submissions -> Log_Survey_test_quarantine.csv; deletes unless dry_run."""
+    return purge_test_submissions(
+        df_survey_translated,
+        data_dir,
+        pattern,
+        quarantine_path=output_directory / "Log_Survey_test_quarantine.csv",
+        dry_run=dry_run,
+    )
+
+
+if __name__ == "__main__":
+    # Dry run: review the quarantine list, then rerun with dry_run=False to delete
+    test_quarantine = purge_tests(
+        df_survey_translated, data_dir, pattern, output_directory, dry_run=True
+    )
 
 # %%
 ########## Remove Non answered - No survey
-df_unique = df_survey_translated[~df_survey_translated.duplicated(keep=False)]
-df_unique.to_csv(output_directory / "Log_Survey_Processed.csv")
+# Identical submissions keep their earliest copy; duplicated(keep=False) used
+# to drop every copy. A group of identical non-empty submissions therefore
+# adds one row, e.g. the visitors who answered nothing but their nationality
+# (not a pre-filled answer, so not an empty submission).
+from utils import deduplicate_surveys
+
+
+def deduplicate(
+    df_survey_translated, output_directory, config_dir=Path("."), recheck_ids=None
+):
+    """
+    Translated table -> Log_Survey_Processed.csv. Only the visitors in
+    recheck_ids (default: everyone) and the ones not in the hash index yet
+    are hashed.
+    """
+    form_defaults = load_yaml(config_dir / "mapping_questions.yaml")["form_defaults"]
+    df_unique, hash_index = deduplicate_surveys(
+        df_survey_translated,
+        output_directory / "Log_Survey_hashes.csv",
+        form_defaults,
+        recheck_ids=(
+            df_survey_translated.index if recheck_ids is None else recheck_ids
+        ),
+        # Hashes are taken after translation: other mappings mean other hashes
+        config=[
+            load_yaml(config_dir / "mapping_response.yaml")["mapping_response"],
+            load_yaml(config_dir / "mapping_nationality.yaml"),
+        ],
+    )
+    df_unique.to_csv(output_directory / "Log_Survey_Processed.csv")
+    return df_unique, hash_index
+
+
+if __name__ == "__main__":
+    # Rebuilds hash everyone again; incremental runs only new/changed files
+    df_unique, hash_index = deduplicate(
+        df_survey_translated,
+        output_directory,
+        config_directory,
+        recheck_ids=None if changes["rebuilt"] else changes["changed"],
+    )
 
 # %%
-########## Convert strings to list
-from utils import str_to_list
+########## Typed table: categoricals, ordered scales and list columns
+from utils import apply_survey_schema, write_survey_parquet
+
 
-df_unique = pd.read_csv("data/Log_Survey_Processed.csv", index_col=0)
+def write_typed_table(df_unique, output_directory, config_dir=Path(".")):
+    """Processed table -> Log_Survey.parquet, typed as in survey_schema.yaml."""
+    survey_schema = load_yaml(config_dir / "survey_schema.yaml")
+    df_typed = apply_survey_schema(
+        df_unique, survey_schema["schema"], survey_schema["scales"]
+    )
+    write_survey_parquet(
+        df_typed, output_directory / "Log_Survey.parquet", survey_schema["schema"]
+    )
+    return df_typed
 
-str_to_list_columns = [
-    "visit_purpose",
-    "personal_connection_details",
-    "known_persecuted_groups_open",
-    "technologies_used",
-]
-for col in str_to_list_columns:
-    df_unique[col] = df_unique[col].apply(str_to_list)
 
-df_unique.to_parquet("data/Log_Survey.parquet")
+if __name__ == "__main__":
+    df_typed = write_typed_table(df_unique, output_directory, config_directory)
 # %%
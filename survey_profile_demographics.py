@@ -1,43 +1,23 @@
 # %%
 import ast
+import hashlib
+import json
 import os
 import textwrap
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from utils import str_to_list
-
-df_survey = pd.read_csv("data/Log_Survey_Persona.csv", index_col=0)
-
-columns = [
-    "nationality",
-    "gender_identity",
-    "age",
-    "education_level",
-    "visit_type",
-    "visit_purpose",
-    "religious",
-    "visited_memorial_before",
-    "personal_connection_nazi_history",
-    "personal_connection_details",
-    # "known_persecuted_groups_open",
-    "knowledge_ww2",
-    "technologies_used",
-    "profile",
-]
-
-df_survey_persona = df_survey[columns]
-print(df_survey_persona["profile"].unique())
-
-str_to_list_columns = [
-    "visit_purpose",
-    "personal_connection_details",
-    # "known_persecuted_groups_open",
-    "technologies_used",
-]
-for col in str_to_list_columns:
-    df_survey_persona[col] = df_survey_persona[col].apply(str_to_list)
+from utils import load_survey_parquet, load_yaml, profile_color_map
+
+# Loaded when run as a script or cell by cell, not when the plotting
+# functions are imported (survey_cli.py)
+if __name__ == "__main__":
+    columns = load_yaml("survey_schema.yaml")["demographic_questions"] + ["profile"]
+    df_survey = load_survey_parquet("data/Log_Survey_Persona.parquet")
+    df_survey_persona = df_survey[columns]
+    print(df_survey_persona["profile"].unique())
 
 
 def safely_parse_list_string(val):
@@ -90,7 +70,7 @@ def plot_clean_demographics(
 
     for col in demographic_columns:
         # Flatten individual list items
-        subset[col] = subset[col].apply(safely_parse_list_string)
+        subset[col] = subset[col].astype(object).apply(safely_parse_list_string)
         exploded = subset.explode(col)
         exploded = exploded[~exploded[col].isin(["", [], None, np.nan])]
 
@@ -153,9 +133,9 @@ def plot_clean_demographics(
 
 
 def plot_demographics(
-    df,
-    persona_column,
+    cube,
     persona_value,
+    questions,
     color="#3366FF",
     bar_height=0.4,
     width=12,
@@ -167,27 +147,22 @@ def plot_demographics(
     """
     Plot demographics in subplots, each with proportional height based on number of categories.
     Bar thickness is consistent, plot height is adaptive.
+    Percentages are read from the crosstab cube (survey_crosstab.py).
     """
-    subset = df[df[persona_column] == persona_value].copy()
-    demographic_columns = [col for col in df.columns if col != persona_column]
+    subset = cube[(cube["profile"] == persona_value) & (cube["count"] > 0)]
+    by_question = dict(list(subset.groupby("question", observed=True)))
 
     processed_data = []
     bar_counts = []
 
-    for col in demographic_columns:
-        subset[col] = subset[col].apply(safely_parse_list_string)
-        exploded = subset.explode(col)
-        exploded = exploded[~exploded[col].isin(["", [], None, np.nan])]
-        values = exploded[col].dropna()
-
-        if values.empty or values.nunique() > 50:
+    for col in questions:
+        if col not in by_question or len(by_question[col]) > 50:
             continue
 
         value_counts = (
-            values.value_counts(normalize=True).sort_values(ascending=True)[
-                :max_categories
-            ]
-            * 100
+            by_question[col]
+            .set_index("option")["percentage"]
+            .sort_values(ascending=True)[:max_categories]
         )
         processed_data.append((col.replace("_", " ").capitalize(), value_counts))
         bar_counts.append(len(value_counts))
@@ -260,13 +235,92 @@ def plot_demographics(
     plt.close(fig)
 
 
+def _use_agg_backend():
+    # Workers only write PNGs; no GUI backend needed
+    plt.switch_backend("Agg")
+
+
+def _figure_digest(cube_slice, *params):
+    """Hash of the data and settings a figure is drawn from."""
+    digest = hashlib.sha256(
+        pd.util.hash_pandas_object(cube_slice, index=False).values.tobytes()
+    )
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
 # Apply to all profiles
-def plot_all_profiles(df, profile_column, profiles, output_dir, color_map):
+def plot_all_profiles(
+    cube,
+    questions,
+    profiles,
+    output_dir,
+    color_map,
+    per_question=False,
+    max_workers=None,
+    force=False,
+    cache_file="render_cache.json",
+):
+    """
+    Renders the demographic figures of every profile in a process pool.
+
+    One figure per profile, or one per (profile, question) with
+    per_question=True. The hash of each figure's cube rows and settings is
+    kept in output_dir/cache_file; figures whose hash has not changed since
+    the last render (and whose file still exists) are skipped unless force.
+    Returns the number of figures rendered and skipped.
+    """
+    cache_path = os.path.join(output_dir, cache_file)
+    cache = {}
+    if os.path.exists(cache_path) and not force:
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+
+    jobs = []
+    skipped = 0
     for profile in profiles:
         color = color_map.get(profile, "#3366FF")
-        filename = f"{profile.replace(' ', '_')}_demographics.png"
-        save_path = os.path.join(output_dir, filename)
-        plot_demographics(df, profile_column, profile, color=color, save_path=save_path)
+        prefix = profile.replace(" ", "_")
+        if per_question:
+            targets = [(f"{prefix}_{q}.png", [q]) for q in questions]
+        else:
+            targets = [(f"{prefix}_demographics.png", list(questions))]
+
+        profile_cube = cube[cube["profile"] == profile]
+        for filename, figure_questions in targets:
+            figure_cube = profile_cube[profile_cube["question"].isin(figure_questions)]
+            digest = _figure_digest(figure_cube, profile, figure_questions, color)
+            save_path = os.path.join(output_dir, filename)
+            if cache.get(filename) == digest and os.path.exists(save_path):
+                skipped += 1
+                continue
+            jobs.append(
+                (filename, digest, figure_cube, profile, figure_questions, color)
+            )
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_use_agg_backend
+    ) as executor:
+        futures = {
+            executor.submit(
+                plot_demographics,
+                figure_cube,
+                profile,
+                figure_questions,
+                color=color,
+                save_path=os.path.join(output_dir, filename),
+            ): (filename, digest)
+            for filename, digest, figure_cube, profile, figure_questions, color in jobs
+        }
+        for future in as_completed(futures):
+            filename, digest = futures[future]
+            future.result()
+            cache[filename] = digest
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    print(f"Rendered {len(jobs)} figures, skipped {skipped} unchanged")
+    return len(jobs), skipped
 
 
 profile_colors = {
@@ -277,12 +331,27 @@ profile_colors = {
 }
 
 
-plot_all_profiles(
-    df_survey_persona,
-    "profile",
-    ["Tourist", "Personal Involvement", "Student", "Researcher"],
-    "figures",
-    profile_colors,
-)
+def render_demographics(
+    cube_path, output_dir, schema_path="survey_schema.yaml", max_workers=None
+):
+    """Crosstab cube -> one demographics PNG per profile (plot_all_profiles)."""
+    # Precomputed (question, option, profile) counts, see survey_crosstab.py
+    df_cube = pd.read_parquet(cube_path)
+    questions = load_yaml(schema_path)["demographic_questions"]
+    # Every profile in the cube; ones without a color of their own (new
+    # personas) get a plotly default
+    profiles = df_cube["profile"].unique().tolist()
+    return plot_all_profiles(
+        df_cube,
+        questions,
+        profiles,
+        output_dir,
+        {**profile_color_map(profiles), **profile_colors},
+        max_workers=max_workers,
+    )
+
+
+if __name__ == "__main__":
+    render_demographics("data/Log_Survey_Crosstab.parquet", "figures")
 
 # %%
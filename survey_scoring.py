@@ -0,0 +1,54 @@
+# %%
+from pathlib import Path
+
+from utils import (
+    likert_codes,
+    likert_scale_scores,
+    likert_scale_summary,
+    load_survey_parquet,
+    load_yaml,
+)
+
+
+def score_likert_scales(
+    survey_path, output_directory, schema_path="survey_schema.yaml"
+):
+    """
+    Log_Survey_Persona.parquet -> Log_Survey_Scores.parquet (item codes and
+    scale scores) and Likert_Scale_Summary.csv (per profile).
+    """
+    output_directory = Path(output_directory)
+    df_survey = load_survey_parquet(survey_path)
+    likert_scales = load_yaml(schema_path)["likert_scales"]
+
+    # Items 18-34 as int8 codes (0: no answer), negative items reversed
+    items = [item for spec in likert_scales.values() for item in spec["items"]]
+    reverse = [
+        item for spec in likert_scales.values() for item in spec.get("reverse", [])
+    ]
+    df_codes = likert_codes(df_survey, items, reverse)
+
+    # Scale scores: mean code of the answered items (at least half of them)
+    # Note: the form is pre-filled with 3.Undecided, so untouched items score 3
+    df_scores = likert_scale_scores(df_codes, likert_scales)
+
+    df_codes.join(df_scores).join(df_survey["profile"]).to_parquet(
+        output_directory / "Log_Survey_Scores.parquet"
+    )
+
+    # Scale means and Cronbach's alpha per profile
+    df_summary = likert_scale_summary(
+        df_codes, df_scores, likert_scales, df_survey["profile"]
+    )
+    df_summary.to_csv(output_directory / "Likert_Scale_Summary.csv", index=False)
+    return df_scores, df_summary
+
+
+# %%
+if __name__ == "__main__":
+    df_scores, df_summary = score_likert_scales(
+        "data/Log_Survey_Persona.parquet", "data/"
+    )
+    print(df_summary.round(2).to_string(index=False))
+
+# %%
@@ -185,5 +185,6 @@ from utils import combine_html
 
 combine_html([
     ("reports/persona_mapping.html", "Persona Mapping"),
-    ("reports/UniqueAnswers_perQuestion_Translated.html", "Survey Answers")
+    ("reports/unique_values_translated.html", "Survey Answers"),
+    ("reports/profile_associations.html", "Differences by Profile"),
 ])
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Streaming, resume and invalidation paths of the incremental pipeline:
+iter_json_records, aggregate_interactions, ingest_surveys_incremental and
+deduplicate_surveys.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+from utils import (
+    aggregate_interactions,
+    deduplicate_surveys,
+    index_log_files,
+    ingest_surveys_incremental,
+    iter_json_records,
+)
+
+FIELDS = {"timestamp": "timestamp", "scene": "scene", "hotspot": "hotspot"}
+QUESTIONS = ["1. Where are you from?", "2. How old are you?", "3. Why are you here?"]
+COLUMNS = ["nationality", "age", "visit_purpose"]
+
+
+# %% iter_json_records
+
+RECORDS = [
+    {"timestamp": 1732843110739, "scene": "gate", "note": 'a "quoted" ] bracket'},
+    {"timestamp": 1732843111739, "scene": "camp [1]", "note": "{not: an object}"},
+    {"timestamp": 1732843112739.5, "scene": "ümlaut \\u00fc", "values": [1, [2, 3]]},
+    12345678901234567890,
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 16])
+def test_records_split_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / "Log_Interaction_1.json"
+    path.write_text(json.dumps(RECORDS, indent=1), encoding="utf-8")
+
+    assert list(iter_json_records(path, chunk_size=chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_records_under_an_events_key(tmp_path, chunk_size):
+    path = tmp_path / "Log_Interaction_1.json"
+    log = {"device": {"events": "not this one"}, "events": RECORDS, "tail": [0]}
+    path.write_text(json.dumps(log), encoding="utf-8")
+
+    # The first "events": [ is taken; the quoted string is not a list
+    records = list(iter_json_records(path, "events", chunk_size=chunk_size))
+    assert records == RECORDS
+
+
+def test_truncated_log_stops_at_the_last_complete_record(tmp_path):
+    path = tmp_path / "Log_Interaction_1.json"
+    # Cut inside the last number, which must not come back as a shorter one
+    path.write_text(json.dumps(RECORDS)[:-10], encoding="utf-8")
+
+    assert list(iter_json_records(path, chunk_size=4)) == RECORDS[:3]
+
+
+# %% aggregate_interactions
+
+
+def _write_events(directory, visitor_id, n_events, start=1_700_000_000_000):
+    events = [
+        {"timestamp": start + 1000 * i, "scene": f"s{i % 3}", "hotspot": f"h{i % 4}"}
+        for i in range(n_events)
+    ]
+    path = directory / f"Log_Interaction_{visitor_id}.json"
+    path.write_text(json.dumps(events), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def interaction_logs(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for visitor_id in range(1000, 1012):
+        _write_events(logs, visitor_id, 10 + visitor_id % 7)
+    return logs
+
+
+def _aggregate(logs, **kwargs):
+    return aggregate_interactions(
+        index_log_files(logs), ["Log_Interaction"], FIELDS, **kwargs
+    )
+
+
+def test_dwell_is_carried_between_batches(interaction_logs):
+    whole = _aggregate(interaction_logs, batch_size=10_000)
+    batched = _aggregate(interaction_logs, batch_size=1, chunk_size=8)
+
+    pd.testing.assert_frame_equal(batched, whole)
+    # 1 s between events, so the dwell adds up to the session length
+    dwell = whole.filter(like="dwell_").sum(axis=1)
+    assert (dwell == whole["session_length_s"]).all()
+
+
+def test_resume_from_a_cut_checkpoint(interaction_logs, tmp_path, capsys):
+    fresh = _aggregate(interaction_logs)
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    _aggregate(interaction_logs, checkpoint_path=checkpoint, checkpoint_every=5)
+
+    # Crash while appending the 6th entry
+    lines = checkpoint.read_text(encoding="utf-8").splitlines()
+    checkpoint.write_text("\n".join(lines[:5]) + "\n" + lines[5][:30], "utf-8")
+    capsys.readouterr()
+
+    resumed = _aggregate(interaction_logs, checkpoint_path=checkpoint)
+    assert "7 read, 5 unchanged" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(resumed, fresh)
+    assert len(checkpoint.read_text(encoding="utf-8").splitlines()) == 12
+
+
+def test_checkpoint_follows_changed_and_deleted_logs(interaction_logs, tmp_path):
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    _aggregate(interaction_logs, checkpoint_path=checkpoint)
+
+    os.remove(interaction_logs / "Log_Interaction_1000.json")
+    _write_events(interaction_logs, 1001, 40)
+    updated = _aggregate(interaction_logs, checkpoint_path=checkpoint)
+
+    pd.testing.assert_frame_equal(updated, _aggregate(interaction_logs))
+    assert "1000" not in updated.index
+    assert updated.loc["1001", "events"] == 40
+
+
+# %% ingest_surveys_incremental
+
+
+def _write_survey(directory, visitor_id, answers, questions=QUESTIONS):
+    survey = [{"question": q, "answer": a} for q, a in zip(questions, answers)]
+    path = directory / f"Log_Survey_BB_{visitor_id}.json"
+    path.write_text(json.dumps(survey), encoding="utf-8")
+
+
+@pytest.fixture
+def survey_logs(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for i in range(5):
+        _write_survey(logs, 1000 + i, ["Germany", str(20 + i), ""])
+    return logs
+
+
+def _ingest(logs, tmp_path, **kwargs):
+    kwargs.setdefault("columns", COLUMNS)
+    return ingest_surveys_incremental(
+        logs,
+        "Log_Survey*.json",
+        tmp_path / "Log_Survey.csv",
+        tmp_path / "Log_Survey_manifest.json",
+        QUESTIONS,
+        **kwargs,
+    )
+
+
+def test_full_rebuild_then_incremental_run(survey_logs, tmp_path):
+    _ingest(survey_logs, tmp_path)
+    _write_survey(survey_logs, 2000, ["France", "31", "Research"])
+    table, changes = _ingest(survey_logs, tmp_path, force=True)
+    assert changes["rebuilt"] and len(table) == 6
+
+    _write_survey(survey_logs, 3000, ["Italy", "45", ""])
+    os.remove(survey_logs / "Log_Survey_BB_1000.json")
+    table, changes = _ingest(survey_logs, tmp_path)
+
+    assert not changes["rebuilt"]
+    assert changes["added"] == ["3000"] and changes["deleted"] == ["1000"]
+    assert table.index.is_unique and len(table) == 6
+    reread = pd.read_csv(tmp_path / "Log_Survey.csv", index_col=0, dtype=str)
+    assert sorted(reread.index.astype(str)) == sorted(table.index)
+
+
+def test_question_config_change_rebuilds(survey_logs, tmp_path):
+    _ingest(survey_logs, tmp_path)
+    table, changes = _ingest(
+        survey_logs, tmp_path, columns=["nationality", "age", "reason"]
+    )
+
+    assert changes["rebuilt"]
+    assert list(table.columns) == ["nationality", "age", "reason"]
+    assert table["reason"].isna().all() and len(table) == 5
+
+
+def test_manifest_without_fingerprint_rebuilds_once(survey_logs, tmp_path):
+    _ingest(survey_logs, tmp_path)
+    manifest_path = tmp_path / "Log_Survey_manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest_path.write_text(json.dumps(manifest["files"]), encoding="utf-8")
+
+    assert _ingest(survey_logs, tmp_path)[1]["rebuilt"]
+    assert not _ingest(survey_logs, tmp_path)[1]["rebuilt"]
+
+
+# %% deduplicate_surveys
+
+FORM_DEFAULTS = ["3.Undecided"]
+
+
+@pytest.fixture
+def translated():
+    return pd.DataFrame(
+        {
+            "nationality": ["Germany", "deutsch", "France", None, "France"],
+            "opinion": ["2.Agree", "2.Agree", "1.Yes", "3.Undecided", "1.Yes"],
+        },
+        index=pd.Index(["1001", "1002", "1003", "1004", "1005"]),
+    )
+
+
+def _statuses(index):
+    return index.set_index("id")["status"].to_dict()
+
+
+def test_dedup_keeps_the_first_copy_and_separates_empty(translated, tmp_path):
+    unique, index = deduplicate_surveys(
+        translated, tmp_path / "hashes.csv", FORM_DEFAULTS, config={}
+    )
+
+    assert _statuses(index) == {
+        "1001": "unique",
+        "1002": "unique",
+        "1003": "unique",
+        "1004": "empty",
+        "1005": "duplicate",
+    }
+    assert list(unique.index) == ["1001", "1002", "1003"]
+
+
+def test_dedup_config_change_rehashes_everyone(translated, tmp_path, capsys):
+    index_path = tmp_path / "hashes.csv"
+    deduplicate_surveys(translated, index_path, FORM_DEFAULTS, config={})
+
+    # A new nationality mapping makes 1002 a copy of 1001, with no log change
+    mapping = {"deutsch": "Germany"}
+    retranslated = translated.replace(mapping)
+    capsys.readouterr()
+    unique, index = deduplicate_surveys(
+        retranslated, index_path, FORM_DEFAULTS, recheck_ids=[], config=mapping
+    )
+
+    assert "5 newly hashed" in capsys.readouterr().out
+    assert _statuses(index)["1002"] == "duplicate"
+    assert list(unique.index) == ["1001", "1003"]
+
+    # Same settings again: nothing to rehash
+    deduplicate_surveys(
+        retranslated, index_path, FORM_DEFAULTS, recheck_ids=[], config=mapping
+    )
+    assert "0 newly hashed" in capsys.readouterr().out
+
+
+def test_dedup_form_defaults_change_rehashes(translated, tmp_path):
+    index_path = tmp_path / "hashes.csv"
+    deduplicate_surveys(translated, index_path, FORM_DEFAULTS, config={})
+
+    _, index = deduplicate_surveys(
+        translated, index_path, FORM_DEFAULTS + ["2.Agree"], recheck_ids=[], config={}
+    )
+    # 1001 and 1002 still differ in nationality, so they are not empty
+    assert _statuses(index)["1002"] == "unique"
+    _, index = deduplicate_surveys(
+        translated.drop(columns="nationality"),
+        index_path,
+        FORM_DEFAULTS + ["2.Agree"],
+        recheck_ids=[],
+        config={},
+    )
+    assert _statuses(index)["1001"] == "empty"
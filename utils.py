@@ -3,7 +3,10 @@ import fnmatch  # Pattern matching
 import json  # Load JSON filetype
 import os
 import re  # Regular expressions
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import numpy as np
+import pandas as pd
 import yaml  # Load Yaml filetype
 
 
@@ -46,69 +49,1932 @@ def load_json_files(data_dir, pattern):
         pattern: Filename pattern to match (e.g., 'data_*.json').
 
     Returns:
-        A list of dictionaries, where each dictionary represents a matched JSON file.
+        A list of dictionaries, where each dictionary represents a matched JSON file.
+    """
+
+    # List all files in folder
+    json_files = match_files(data_dir, pattern)
+
+    # List of python objects
+    data = [load_json(file_path) for file_path in json_files if file_path]
+
+    return data
+
+
+def question_key(question):
+    """Returns the number of a question ("1", "10A", ...), or None if it has none.
+
+    The numbering is shared by every language of the form, so it identifies a
+    question whichever language the kiosk was set to.
+    """
+    match = re.match(r"\s*(\d+[A-Z]?)\.", str(question))
+    return match.group(1) if match else None
+
+
+def _question_order(survey, expected_keys, layouts):
+    """Positions of a file's records in the reference question order.
+
+    Returns None when the file does not contain exactly the reference
+    questions. Results are cached per distinct question list in `layouts`, so
+    each layout (e.g. one per language) is only checked once.
+    """
+    layout = tuple(record.get("question") for record in survey)
+    if layout not in layouts:
+        keys = [question_key(q) for q in layout]
+        if keys == expected_keys:
+            layouts[layout] = list(range(len(keys)))
+        elif len(set(keys)) == len(keys) and set(keys) == set(expected_keys):
+            # Same questions in another order: realign by question number
+            position = {key: i for i, key in enumerate(keys)}
+            layouts[layout] = [position[key] for key in expected_keys]
+        else:
+            layouts[layout] = None
+    return layouts[layout]
+
+
+def assemble_survey_table(surveys, questions, columns=None, n_rows=None):
+    """Streams parsed survey files into a table with one row per visitor.
+
+    Answers are written straight into preallocated per-question arrays, so no
+    per-file DataFrames are built and nothing needs to be transposed. The
+    questions of every file are checked against the reference questions by
+    their number: files in another order are realigned, files with other
+    questions are skipped.
+
+    Args:
+        surveys: Iterable of (visitor_id, survey) pairs, where survey is the
+            parsed list of {"question", "answer"} records (None if unreadable).
+        questions: Reference questions, in order (english_questions.csv).
+        columns: Column names for the questions (default: the questions).
+        n_rows: Expected number of files, to size the arrays up front.
+
+    Returns:
+        A DataFrame with one row per visitor, indexed by visitor ID.
+    """
+    questions = list(questions)
+    columns = questions if columns is None else list(columns)
+    expected_keys = [question_key(q) for q in questions]
+
+    if n_rows is None and hasattr(surveys, "__len__"):
+        n_rows = len(surveys)
+    capacity = max(n_rows or 1024, 1)
+    arrays = [np.empty(capacity, dtype=object) for _ in questions]
+
+    visitor_ids = []
+    layouts = {}
+    for visitor_id, survey in surveys:
+        if survey is None:
+            continue
+        order = _question_order(survey, expected_keys, layouts)
+        if order is None:
+            print(f"Skipping {visitor_id}: questions do not match the reference")
+            continue
+
+        row = len(visitor_ids)
+        if row == capacity:
+            capacity *= 2
+            grown = [np.empty(capacity, dtype=object) for _ in questions]
+            for new, old in zip(grown, arrays):
+                new[:row] = old
+            arrays = grown
+
+        for array, position in zip(arrays, order):
+            array[row] = survey[position].get("answer")
+        visitor_ids.append(visitor_id)
+
+    n = len(visitor_ids)
+    return pd.DataFrame(
+        {column: array[:n] for column, array in zip(columns, arrays)},
+        index=pd.Index(visitor_ids),
+        columns=columns,
+    )
+
+
+def load_json_files_parallel(
+    data_dir, pattern, questions, columns=None, max_workers=None, use_processes=False
+):
+    """Loads survey JSON files with a pool of workers into one table.
+
+    Files are read and parsed concurrently; rows are sorted by visitor ID so the
+    result does not depend on the directory listing order. JSON decoding holds
+    the GIL, so a process pool scales better on many cores; threads start
+    faster and are enough when reads dominate.
+
+    Args:
+        data_dir: Path to the directory containing JSON files.
+        pattern: Filename pattern to match (e.g., 'Log_Survey*.json').
+        questions: Reference questions, in order (english_questions.csv).
+        columns: Column names for the questions (default: the questions).
+        max_workers: Number of workers (default: the executor's default).
+        use_processes: Use a process pool instead of a thread pool.
+
+    Returns:
+        A DataFrame with one row per visitor, indexed by the ID in the filename.
+    """
+    # One directory scan; IDs and paths stay paired
+    entries = [
+        (visitor_id, path)
+        for visitor_id, path, _ in iter_survey_files(data_dir, pattern)
+    ]
+    visitor_ids = [visitor_id for visitor_id, _ in entries]
+    json_files = [path for _, path in entries]
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        surveys = executor.map(load_json, json_files, chunksize=64)
+        table = assemble_survey_table(
+            zip(visitor_ids, surveys), questions, columns, n_rows=len(json_files)
+        )
+
+    # Listing order is filesystem dependent; the visitor ID order is not
+    return table.sort_index()
+
+
+def extract_id(filename):
+    """Extracts the numeric ID from the filename."""
+    match = re.search(r"_(\d+)\.json$", filename)
+    return match.group(1) if match else None
+
+
+def extract_id_files(data_dir, pattern="Log_Survey_BB_*.json"):
+    """
+    Extracts numeric IDs from filenames matching a given pattern.
+
+    Args:
+        data_dir (str): Path to the directory containing files.
+        pattern (str): Filename pattern to match (default: 'Log_Survey_BB_*.json').
+
+    Returns:
+        list: A list of extracted numeric IDs as strings.
+    """
+
+    # List all matching files
+    files = match_files(data_dir, pattern)
+
+    # Extract IDs and filter out None values
+    ids = [extract_id(file) for file in files]
+
+    return ids
+
+
+def visit_timestamps(visitor_ids):
+    """
+    Submission times of the visitors: their IDs are epoch milliseconds.
+
+    Args:
+        visitor_ids (Iterable): Visitor IDs as strings or integers.
+
+    Returns:
+        pd.DatetimeIndex: One timestamp per ID, NaT where the ID is not numeric.
+    """
+    millis = pd.to_numeric(pd.Index(visitor_ids), errors="coerce")
+    return pd.DatetimeIndex(pd.to_datetime(millis, unit="ms"))
+
+
+def iter_survey_files(data_dir, pattern="Log_Survey_BB_*.json"):
+    """
+    Lists a directory once and yields each matching file with its ID.
+
+    The ID always travels with its own path, so pairing answers with visitors
+    does not depend on the listing order. Being a generator, huge directories
+    can be processed while they are still being listed.
+
+    Args:
+        data_dir (str): Path to the directory containing files.
+        pattern (str): Filename pattern to match (default: 'Log_Survey_BB_*.json').
+
+    Yields:
+        tuple: (visitor ID, file path, os.stat_result) for every file whose
+        name matches the pattern and contains an ID.
+    """
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if not fnmatch.fnmatch(entry.name, pattern) or not entry.is_file():
+                continue
+            visitor_id = extract_id(entry.name)
+            if visitor_id is None:
+                continue
+            yield visitor_id, os.path.join(data_dir, entry.name), entry.stat()
+
+
+def str_to_list(string):
+    if pd.isna(string):
+        return []
+    return string.split(sep="__")
+
+
+def visitor_profile(df, personas_path="personas.yaml"):
+    """Assigns each visitor the profile of the first matching persona (personas.yaml)."""
+    rules = compile_persona_rules(load_yaml(personas_path))
+    df["profile"], _ = classify_personas(df, rules)
+    return df
+
+
+#################
+#   Ingestion   #
+#################
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def config_fingerprint(*configs):
+    """sha256 of settings (lists, dicts, ...) that derived tables depend on."""
+    return hashlib.sha256(
+        json.dumps(configs, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def scan_survey_manifest(data_dir, pattern):
+    """
+    Builds a manifest of the survey files currently in a directory.
+
+    Args:
+        data_dir (str): Path to the directory containing the survey files.
+        pattern (str): Filename pattern to match (e.g., 'Log_Survey*.json').
+
+    Returns:
+        dict: Visitor ID -> {"path", "size", "mtime"} for every matching file.
+    """
+    manifest = {}
+    for visitor_id, file_path, stat in iter_survey_files(data_dir, pattern):
+        manifest[visitor_id] = {
+            "path": file_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }
+    return manifest
+
+
+def load_manifest(manifest_path):
+    """
+    Loads a survey manifest: {"fingerprint": fingerprint of the question
+    config the table was built with, "files": scan_survey_manifest output}.
+    Empty if it does not exist yet.
+    """
+    if not os.path.exists(manifest_path):
+        return {"fingerprint": None, "files": {}}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if "files" not in manifest:
+        # Written before the fingerprint was stored: rebuild once
+        return {"fingerprint": None, "files": manifest}
+    return manifest
+
+
+def save_manifest(manifest, manifest_path):
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def diff_manifest(previous, current):
+    """
+    Compares two manifests.
+
+    Returns:
+        dict: Lists of visitor IDs that were "added", "changed" or "deleted".
+    """
+    added = [i for i in current if i not in previous]
+    changed = [
+        i
+        for i in current
+        if i in previous
+        and (
+            current[i]["size"] != previous[i]["size"]
+            or current[i]["mtime"] != previous[i]["mtime"]
+        )
+    ]
+    deleted = [i for i in previous if i not in current]
+    return {"added": added, "changed": changed, "deleted": deleted}
+
+
+def ingest_surveys_incremental(
+    data_dir,
+    pattern,
+    table_path,
+    manifest_path,
+    questions,
+    columns=None,
+    force=False,
+    max_workers=None,
+):
+    """
+    Updates the survey table with only the files that are new or changed since
+    the last run, and drops the visitors whose files were deleted.
+
+    The manifest is keyed by visitor ID and stores the size and mtime of each
+    ingested file, with a fingerprint of the questions and column names the
+    table was built with. Table and manifest are only trusted together: if
+    either is missing, if the questions or columns changed, or with force,
+    every file is ingested again and both are rewritten.
+
+    Args:
+        data_dir (str): Path to the directory containing the survey files.
+        pattern (str): Filename pattern to match (e.g., 'Log_Survey*.json').
+        table_path (str): CSV with one row per visitor (read and rewritten).
+        manifest_path (str): JSON manifest of the files already in the table.
+        questions (list): Reference questions, in order (english_questions.csv).
+        columns (list): Column names for the questions (default: the questions).
+        force (bool): Parse every file, whatever the manifest says.
+        max_workers (int): Loader pool size (default: the executor's default).
+
+    Returns:
+        tuple: (survey table, dict of added/changed/deleted visitor IDs
+        relative to the previous manifest, and whether the table was
+        "rebuilt").
+    """
+    questions = list(questions)
+    columns = list(questions if columns is None else columns)
+    fingerprint = config_fingerprint(questions, columns)
+
+    previous = load_manifest(manifest_path)
+    current = scan_survey_manifest(data_dir, pattern)
+    changes = diff_manifest(previous["files"], current)
+    rebuild = (
+        force
+        or previous["fingerprint"] != fingerprint
+        or not os.path.exists(table_path)
+    )
+
+    if rebuild:
+        table = pd.DataFrame(columns=columns)
+        to_parse = sorted(current)
+    else:
+        table = pd.read_csv(table_path, index_col=0, dtype=str)
+        table.index = table.index.astype(str)
+        # Stale rows: files that disappeared or were rewritten
+        table = table.drop(
+            index=changes["changed"] + changes["deleted"], errors="ignore"
+        )
+        to_parse = changes["added"] + changes["changed"]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        surveys = executor.map(
+            load_json, [current[i]["path"] for i in to_parse], chunksize=64
+        )
+        new_rows = assemble_survey_table(
+            zip(to_parse, surveys), questions, columns, n_rows=len(to_parse)
+        )
+    # Leave unreadable or mismatched files out of the manifest: retried next run
+    for visitor_id in set(to_parse) - set(new_rows.index):
+        del current[visitor_id]
+
+    if len(new_rows):
+        # Same missing values as the rows read back from the CSV
+        new_rows = new_rows.mask(new_rows == "")
+        table = pd.concat([table, new_rows]) if len(table) else new_rows
+    table = table.sort_index()
+
+    # Table first: a manifest must never describe rows that were not written
+    table.to_csv(table_path)
+    save_manifest({"fingerprint": fingerprint, "files": current}, manifest_path)
+
+    changes["rebuilt"] = rebuild
+    print(
+        f"{'Rebuilt the table from' if rebuild else 'Ingested'} {len(new_rows)} "
+        f"files ({len(changes['added'])} new, {len(changes['changed'])} changed), "
+        f"dropped {len(changes['deleted'])} deleted."
+    )
+    return table, changes
+
+
+#################
+# Normalization #
+#################
+
+
+def normalize_responses(df, mapping):
+    """
+    Applies the response mapping to every column, with the same result as
+    df.replace(mapping) but without scanning every cell against every rule.
+
+    Each column is factorized once, the mapping is looked up for its distinct
+    values only, and the resulting per-column lookup table is indexed with the
+    codes to rebuild the column.
+
+    Args:
+        df (pd.DataFrame): Survey table.
+        mapping (dict): Original value -> normalized value (mapping_response.yaml).
+
+    Returns:
+        tuple: (normalized DataFrame, DataFrame with the number of cells
+        touched by each rule, per column).
+    """
+    normalized = {}
+    hits = []
+
+    for col in df.columns:
+        codes, uniques = pd.factorize(df[col])
+        lookup = np.empty(len(uniques) + 1, dtype=object)
+        lookup[:-1] = uniques
+        lookup[-1] = np.nan  # Code -1 (missing) picks the last entry
+
+        matched = []
+        for code, value in enumerate(lookup[:-1]):
+            try:
+                if value in mapping:
+                    lookup[code] = mapping[value]
+                    matched.append(code)
+            except TypeError:  # Unhashable values (e.g. lists) are left as is
+                continue
+
+        if not matched:
+            normalized[col] = df[col]
+            continue
+
+        normalized[col] = pd.Series(lookup[codes], index=df.index, name=col)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        hits += [(col, uniques[code], lookup[code], counts[code]) for code in matched]
+
+    report = pd.DataFrame(hits, columns=["column", "value", "replacement", "cells"])
+    report = report.sort_values("cells", ascending=False, ignore_index=True)
+    return pd.DataFrame(normalized, index=df.index), report
+
+
+import difflib
+import hashlib
+
+
+def normalize_text(value):
+    """Collapses whitespace and case-folds a free-text answer."""
+    return " ".join(str(value).split()).casefold()
+
+
+def build_nationality_index(mapping, canonical, special_values=(), aliases=None):
+    """
+    Builds the case-folded lookup index for nationality answers.
+
+    Canonical and special values index themselves. mapping_response.yaml and the extra
+    aliases contribute every variant that resolves to a canonical name or to
+    one of the special values (e.g. "Spam").
+
+    Returns:
+        dict: Normalized variant -> canonical value.
+    """
+    targets = set(canonical) | set(special_values)
+    index = {normalize_text(name): name for name in targets}
+    for variants in (mapping, aliases or {}):
+        for variant, value in variants.items():
+            if value in targets:
+                index.setdefault(normalize_text(variant), value)
+    return index
+
+
+def canonicalize_nationality(series, index, cache_path=None, cutoff=0.85, min_length=4):
+    """
+    Resolves free-text nationality answers to canonical country names.
+
+    Each distinct answer is resolved once: whitespace and case are normalized
+    and looked up in the index; answers not in the index are matched against
+    it by similarity (difflib ratio, close to a normalized edit distance).
+    Fuzzy resolutions, including failed ones, are cached to disk so that new
+    typos are only resolved the first time they are seen.
+
+    Args:
+        series (pd.Series): Nationality answers.
+        index (dict): Normalized variant -> canonical value (build_nationality_index).
+        cache_path (str): JSON cache of fuzzy resolutions (optional).
+        cutoff (float): Minimum similarity for a fuzzy match.
+        min_length (int): Shorter answers are never fuzzy matched.
+
+    Returns:
+        tuple: (canonicalized series, DataFrame with one row per distinct
+        answer: value, canonical, method).
+    """
+    # Any change to the index invalidates the cached resolutions
+    fingerprint = hashlib.sha256(
+        json.dumps([sorted(index.items()), cutoff, min_length]).encode("utf-8")
+    ).hexdigest()
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("fingerprint") == fingerprint:
+            cache = stored["resolutions"]
+
+    codes, uniques = pd.factorize(series)
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    lookup[-1] = np.nan  # Code -1 (missing) picks the last entry
+
+    candidates = list(index)
+    resolutions = []
+    for code, value in enumerate(uniques):
+        key = normalize_text(value)
+        if key in index:
+            canonical, method = index[key], "index"
+        elif key in cache:
+            canonical, method = cache[key], "cache"
+        else:
+            match = (
+                difflib.get_close_matches(key, candidates, n=1, cutoff=cutoff)
+                if len(key) >= min_length
+                else []
+            )
+            canonical = index[match[0]] if match else None
+            cache[key] = canonical
+            method = "fuzzy"
+        if canonical is None:
+            method = "unresolved"
+        # Unresolved answers are kept, only trimmed
+        lookup[code] = (
+            canonical if canonical is not None else " ".join(str(value).split())
+        )
+        resolutions.append((value, lookup[code], method))
+
+    if cache_path:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"fingerprint": fingerprint, "resolutions": cache},
+                f,
+                indent=1,
+                ensure_ascii=False,
+                sort_keys=True,
+            )
+
+    canonicalized = pd.Series(lookup[codes], index=series.index, name=series.name)
+    report = pd.DataFrame(resolutions, columns=["value", "canonical", "method"])
+    return canonicalized, report
+
+
+#################
+# Deduplication #
+#################
+
+
+def row_hashes(df):
+    """
+    Stable 64-bit content hash of every row, independent of the index.
+
+    Missing values hash like empty answers, and every value is hashed through
+    its string form, so the hash does not depend on column dtypes.
+    """
+    canonical = df.astype(object).where(df.notna(), "").astype(str)
+    return pd.util.hash_pandas_object(canonical, index=False)
+
+
+def empty_submissions(df, form_defaults):
+    """Rows where every answer is missing or still the form's pre-filled value."""
+    return (df.isna() | df.isin(form_defaults)).all(axis=1)
+
+
+def deduplicate_surveys(df, index_path, form_defaults, recheck_ids=(), config=None):
+    """
+    Separates empty submissions and repeated submissions from real answers,
+    keeping a persistent hash index so only new visitors are hashed.
+
+    Each visitor is classified once as "empty" (nothing but pre-filled
+    answers), "duplicate" (same content as an earlier visitor) or "unique".
+    Visitors already in the index keep their status unless listed in
+    recheck_ids (e.g. files that changed); visitors no longer in df are
+    dropped, and if the kept copy of a duplicate group disappears the
+    earliest remaining duplicate takes its place.
+
+    Hashes are taken from the translated table, so every row stores the
+    fingerprint of the settings it was hashed with: form_defaults, the
+    columns of df and `config`, the mappings the table was translated with.
+    When they change, every visitor is hashed and classified again.
+
+    Args:
+        df (pd.DataFrame): Translated survey table, indexed by visitor ID.
+        index_path (str): CSV hash index (id, hash, status, fingerprint),
+            read and rewritten.
+        form_defaults (list): Pre-filled answers (mapping_questions.yaml).
+        recheck_ids (list): Visitor IDs to hash and classify again.
+        config: Translation settings (e.g. mapping_response.yaml and
+            mapping_nationality.yaml), anything json serializable.
+
+    Returns:
+        tuple: (DataFrame of unique submissions, hash index DataFrame).
+    """
+    visitor_ids = df.index.astype(str)
+    fingerprint = config_fingerprint(list(form_defaults), list(df.columns), config)
+    if os.path.exists(index_path):
+        index = pd.read_csv(
+            index_path, dtype={"id": str, "hash": "uint64", "fingerprint": str}
+        )
+        if "fingerprint" not in index:  # Written before fingerprints were stored
+            index["fingerprint"] = None
+        index = index[index["id"].isin(visitor_ids)]
+        index = index[~index["id"].isin(pd.Index(recheck_ids).astype(str))]
+        # Hashed with other mappings: the translated answers may differ
+        index = index[index["fingerprint"] == fingerprint]
+    else:
+        index = pd.DataFrame(
+            {
+                "id": pd.Series(dtype=str),
+                "hash": pd.Series(dtype="uint64"),
+                "status": pd.Series(dtype=str),
+                "fingerprint": pd.Series(dtype=str),
+            }
+        )
+
+    # Only visitors that are not in the index yet are hashed
+    is_new = ~visitor_ids.isin(index["id"])
+    new = df[is_new].set_axis(visitor_ids[is_new]).sort_index()
+    hashes = row_hashes(new)
+    empty = empty_submissions(new, form_defaults)
+
+    seen = index.loc[index["status"] != "empty", "hash"]
+    content = hashes[~empty]
+    repeated = content.duplicated(keep="first") | content.isin(seen)
+    status = pd.Series("empty", index=new.index)
+    status[~empty] = np.where(repeated, "duplicate", "unique")
+
+    index = pd.concat(
+        [
+            index,
+            pd.DataFrame(
+                {
+                    "id": new.index,
+                    "hash": hashes.to_numpy(),
+                    "status": status.to_numpy(),
+                    "fingerprint": fingerprint,
+                }
+            ),
+        ],
+        ignore_index=True,
+    ).sort_values("id", ignore_index=True)
+
+    # A duplicate group whose kept copy was deleted keeps its earliest visitor
+    content = index["status"] != "empty"
+    kept = index.loc[content & (index["status"] == "unique"), "hash"]
+    orphans = index[content & ~index["hash"].isin(kept)].drop_duplicates("hash")
+    index.loc[orphans.index, "status"] = "unique"
+
+    index.to_csv(index_path, index=False)
+
+    counts = index["status"].value_counts()
+    print(
+        f"{counts.get('unique', 0)} unique, {counts.get('duplicate', 0)} duplicate, "
+        f"{counts.get('empty', 0)} empty submissions ({len(new)} newly hashed)."
+    )
+    unique_ids = index.loc[index["status"] == "unique", "id"]
+    return df[visitor_ids.isin(unique_ids)], index
+
+
+#################
+#  Multiselect  #
+#################
+
+from scipy import sparse
+
+
+def split_multiselect(series, sep="__"):
+    """
+    Splits "__"-separated multiselect answers into lists in one pass.
+
+    Only the distinct answers are split (there are few of them); rows get
+    their list through the factorized codes. Missing answers become empty
+    lists, as with str_to_list.
+    """
+    codes, uniques = pd.factorize(series)
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    lookup[:-1] = [str(value).split(sep) for value in uniques]
+    lookup[-1] = []  # Code -1 (missing) picks the last entry
+    return pd.Series(lookup[codes], index=series.index, name=series.name)
+
+
+def _is_list_column(series):
+    first = series.dropna().head(1)
+    return len(first) > 0 and isinstance(first.iloc[0], list)
+
+
+def multiselect_indicators(series, sep="__"):
+    """
+    One-hot encodes a multiselect column as a sparse indicator matrix.
+
+    Accepts "__"-separated strings or lists (split_multiselect). Options are
+    factorized once over all selections, so the matrix is built directly from
+    (row, option) positions without a per-row loop.
+
+    Returns:
+        pd.DataFrame: Sparse uint8 frame, one row per answer and one column
+        per option (sorted), 1 where the option was selected.
+    """
+    if not _is_list_column(series):
+        series = split_multiselect(series, sep)
+    selections = series.explode()
+    selections = selections[selections.notna() & (selections != "")]
+
+    rows = series.index.get_indexer(selections.index)
+    codes, options = pd.factorize(selections.astype(str), sort=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.uint8), (rows, codes)),
+        shape=(len(series), len(options)),
+    )
+    # Repeated selections of one option count once
+    matrix.data[:] = 1
+    return pd.DataFrame.sparse.from_spmatrix(
+        matrix, index=series.index, columns=pd.Index(options, name=series.name)
+    )
+
+
+def multiselect_counts(indicators, groups):
+    """
+    Number of selections of each option per group, as one sparse matrix product
+    (group membership transposed times the indicator matrix).
+
+    Args:
+        indicators (pd.DataFrame): Output of multiselect_indicators.
+        groups (pd.Series): Group of each row (e.g. the visitor profile).
+
+    Returns:
+        pd.DataFrame: Counts with one row per group and one column per option.
+    """
+    codes, labels = pd.factorize(groups.reindex(indicators.index), sort=True)
+    rows = np.flatnonzero(codes >= 0)
+    membership = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, codes[rows])),
+        shape=(len(indicators), len(labels)),
+    )
+    counts = membership.T @ indicators.sparse.to_coo().tocsr()
+    return pd.DataFrame(
+        np.asarray(counts.todense(), dtype=np.int64),
+        index=pd.Index(labels, name=groups.name),
+        columns=indicators.columns,
+    )
+
+
+#################
+#   Personas    #
+#################
+
+PERSONA_SECTIONS = ("age_group", "engagement", "content", "goals")
+
+
+def compile_persona_rules(personas, sections=PERSONA_SECTIONS):
+    """
+    Compiles personas.yaml into a rule table ordered by priority.
+
+    Every (column, values) pair listed under the persona sections becomes a
+    criterion. `match` names the criteria that decide membership; without
+    it, every criterion whose column exists in the survey must match.
+
+    Returns:
+        list: One dict per persona with "name", "profile", "priority",
+        "match", "default" and "criteria" (list of (column, values)).
+    """
+    rules = []
+    for i, persona in enumerate(personas):
+        criteria = [
+            (column, list(values))
+            for section in sections
+            if persona.get(section)
+            for column, values in persona[section][1]
+        ]
+        rules.append(
+            {
+                "name": persona["name"],
+                "profile": persona.get("profile", persona["name"]),
+                "priority": persona.get("priority", i + 1),
+                "match": persona.get("match"),
+                "default": persona.get("default", False),
+                "criteria": criteria,
+            }
+        )
+    return sorted(rules, key=lambda rule: rule["priority"])
+
+
+def _criterion_mask(df, column, values, indicators):
+    """Boolean mask of one criterion; any-of matching on multiselect columns."""
+    if not _is_list_column(df[column]):
+        return df[column].isin(values).to_numpy()
+    if column not in indicators:
+        indicators[column] = multiselect_indicators(df[column])
+    selected = indicators[column].columns.intersection(values)
+    if selected.empty:
+        return np.zeros(len(df), dtype=bool)
+    return indicators[column][selected].sparse.to_dense().to_numpy().any(axis=1)
+
+
+def classify_personas(df, rules):
+    """
+    Classifies every visitor with the compiled persona rules in one pass.
+
+    Each distinct criterion is evaluated once as a vectorized boolean mask;
+    criteria on columns missing from the survey are skipped. The label is
+    the profile of the first persona, by priority, whose matching criteria
+    all hold, or of the default persona.
+
+    Args:
+        df (pd.DataFrame): Survey table (multiselect columns as lists).
+        rules (list): Output of compile_persona_rules.
+
+    Returns:
+        tuple: (profile label per visitor, DataFrame with the share of each
+        persona's criteria that every visitor meets).
+    """
+    masks, indicators, skipped = {}, {}, set()
+    conditions, labels, scores = [], [], {}
+    for rule in rules:
+        met = {}
+        for column, values in rule["criteria"]:
+            if column not in df:
+                skipped.add(column)
+                continue
+            key = (column, tuple(values))
+            if key not in masks:
+                masks[key] = _criterion_mask(df, column, values, indicators)
+            met[column] = met.get(column, True) & masks[key]
+
+        scores[rule["profile"]] = (
+            np.mean(list(met.values()), axis=0) if met else np.zeros(len(df))
+        )
+        if rule["default"]:
+            continue
+        required = [met[c] for c in (rule["match"] or met) if c in met]
+        if required:
+            conditions.append(np.logical_and.reduce(required))
+            labels.append(rule["profile"])
+
+    if skipped:
+        print(f"Persona criteria on missing columns skipped: {sorted(skipped)}")
+
+    default = next((rule["profile"] for rule in rules if rule["default"]), None)
+    profile = np.select(conditions, labels, default=default) if conditions else default
+    return (
+        pd.Series(profile, index=df.index, name="profile", dtype=object),
+        pd.DataFrame(scores, index=df.index),
+    )
+
+
+def persona_feature_matrix(df, rules):
+    """
+    Binary feature matrices of visitors and personas over the same features.
+
+    Features are the (column, option) pairs of the columns the personas
+    refer to: every answer seen in the survey plus every value a persona
+    lists. Single choice columns are one-hot encoded, multiselect columns use
+    their indicator matrix.
+
+    Returns:
+        tuple: (sparse visitors x features matrix, dense personas x features
+        matrix, list of (column, option) features).
+    """
+    columns = list(
+        dict.fromkeys(
+            column for rule in rules for column, _ in rule["criteria"] if column in df
+        )
+    )
+
+    blocks, features = [], []
+    for column in columns:
+        if _is_list_column(df[column]):
+            indicators = multiselect_indicators(df[column])
+            block = indicators.sparse.to_coo().tocsr()
+            options = list(indicators.columns)
+        else:
+            codes, uniques = pd.factorize(df[column])
+            rows = np.flatnonzero(codes >= 0)
+            block = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.uint8), (rows, codes[rows])),
+                shape=(len(df), len(uniques)),
+            )
+            options = [str(option) for option in uniques]
+        # Persona values nobody answered still count in the persona's norm
+        listed = {
+            str(value)
+            for rule in rules
+            for c, values in rule["criteria"]
+            if c == column
+            for value in values
+        }
+        unseen = sorted(listed - set(options))
+        block = sparse.hstack([block, sparse.csr_matrix((len(df), len(unseen)))])
+        blocks.append(block)
+        features += [(column, option) for option in options + unseen]
+
+    visitors = sparse.hstack(blocks, format="csr", dtype=np.float64)
+    position = {feature: i for i, feature in enumerate(features)}
+    personas = np.zeros((len(rules), len(features)))
+    for p, rule in enumerate(rules):
+        for column, values in rule["criteria"]:
+            for value in values:
+                if (column, str(value)) in position:
+                    personas[p, position[(column, str(value))]] = 1
+    return visitors, personas, features
+
+
+def persona_similarity(df, rules):
+    """
+    Cosine similarity of every visitor's answers to every persona.
+
+    Visitors and personas are binary vectors over the same (column, option)
+    features (persona_feature_matrix), so all scores come from a single
+    sparse-dense matrix product, normalized by the vector lengths.
+
+    Returns:
+        pd.DataFrame: One row per visitor, one column per persona profile.
+    """
+    visitors, personas, _ = persona_feature_matrix(df, rules)
+    dots = np.asarray(visitors @ personas.T)
+
+    visitor_norms = np.sqrt(np.asarray(visitors.sum(axis=1)).ravel())
+    persona_norms = np.sqrt(personas.sum(axis=1))
+    norms = np.outer(visitor_norms, persona_norms)
+    scores = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    return pd.DataFrame(
+        scores, index=df.index, columns=[rule["profile"] for rule in rules]
+    )
+
+
+#################
+#   Crosstabs   #
+#################
+
+
+def build_crosstab_cube(df, question_columns, profile_column="profile"):
+    """
+    Counts and within-profile percentages for every (question, option,
+    profile) triple, computed once for all questions.
+
+    Single choice questions are melted into one long table and counted with
+    a single groupby; multiselect questions are counted with one sparse
+    product each (multiselect_counts). Percentages are relative to all the
+    answers a profile gave to the question, as in the per-profile charts.
+
+    Args:
+        df (pd.DataFrame): Survey table with a profile column.
+        question_columns (list): Questions to include.
+        profile_column (str): Column holding the profile of each visitor.
+
+    Returns:
+        pd.DataFrame: Columns question, option, profile, count, percentage
+        and visitors (size of the profile). Every option of a question is
+        listed for every profile, with zero counts where nobody chose it.
+    """
+    profiles = df[profile_column].astype(str)
+    multiselect = [q for q in question_columns if _is_list_column(df[q])]
+    single = [q for q in question_columns if q not in multiselect]
+
+    parts = []
+    if single:
+        long = (
+            df[single]
+            .astype(object)
+            .assign(profile=profiles)
+            .melt(id_vars="profile", var_name="question", value_name="option")
+            .dropna(subset=["option"])
+        )
+        long["option"] = long["option"].astype(str)
+        counts = long.groupby(["question", "option", "profile"]).size()
+        # Same options for every profile: fill the missing pairs with zeros
+        counts = counts.unstack("profile", fill_value=0).stack()
+        parts.append(counts.rename("count").reset_index())
+
+    for question in multiselect:
+        counts = multiselect_counts(multiselect_indicators(df[question]), profiles)
+        counts = counts.rename_axis(index="profile", columns="option").T.stack()
+        parts.append(counts.rename("count").reset_index().assign(question=question))
+
+    cube = pd.concat(parts, ignore_index=True)
+    cube = cube.reindex(columns=["question", "option", "profile", "count"])
+    cube = cube[cube["profile"].isin(profiles.unique())]
+
+    totals = cube.groupby(["question", "profile"])["count"].transform("sum")
+    cube["percentage"] = (cube["count"] / totals * 100).fillna(0)
+    cube["visitors"] = cube["profile"].map(profiles.value_counts())
+    cube["question"] = pd.Categorical(cube["question"], categories=question_columns)
+    return cube.sort_values(["question", "profile", "option"], ignore_index=True)
+
+
+#################
+#  Resampling   #
+#################
+
+
+def _answer_matrices(df, question_columns):
+    """
+    Answers as dense matrices for batched statistics: `answers` has one 0/1
+    column per (question, option) of the crosstab cube and `totals` one
+    column per question with the number of answers each visitor gave to it
+    (1 for single choice, the number of selections for multiselect), so that
+    weights @ answers / weights @ totals are the cube percentages of any
+    weighted group of visitors.
+
+    Returns:
+        tuple: (answers, totals, keys, question_of), where keys lists the
+        (question, option) of every answers column and question_of is the
+        totals column of each.
+    """
+    answers, totals, keys, question_of = [], [], [], []
+    for position, question in enumerate(question_columns):
+        if _is_list_column(df[question]):
+            indicators = multiselect_indicators(df[question])
+            onehot = indicators.sparse.to_coo().toarray()
+            options = indicators.columns.astype(str)
+        else:
+            codes, options = pd.factorize(
+                df[question].astype(object).dropna().astype(str), sort=True
+            )
+            onehot = np.zeros((len(df), len(options)))
+            rows = df.index.get_indexer(df[question].dropna().index)
+            onehot[rows, codes] = 1
+        answers.append(onehot)
+        totals.append(onehot.sum(axis=1))
+        keys += [(question, option) for option in options]
+        question_of += [position] * len(options)
+    return (
+        np.hstack(answers).astype(float),
+        np.column_stack(totals).astype(float),
+        pd.DataFrame(keys, columns=["question", "option"]),
+        np.array(question_of),
+    )
+
+
+def _percentages(weights, answers, totals, question_of):
+    """Cube percentages of every weighted group (rows of weights)."""
+    counts = weights @ answers
+    answered = (weights @ totals)[:, question_of]
+    return np.divide(
+        counts * 100, answered, out=np.zeros_like(counts), where=answered > 0
+    )
+
+
+def resample_crosstab(
+    df,
+    question_columns,
+    profile_column="profile",
+    n_resamples=10_000,
+    confidence=0.95,
+    seed=0,
+    batch_size=500,
+    max_workers=1,
+):
+    """
+    Bootstrap confidence intervals and permutation p-values for the
+    percentages of the crosstab cube (build_crosstab_cube).
+
+    Both are computed in batches of matrix products over all (question,
+    option) columns at once (_answer_matrices):
+
+    - Bootstrap: visitors are resampled with replacement within each profile.
+      A batch of resamples is a matrix of random indices, turned into a
+      matrix of how often each visitor was drawn (resamples x visitors), so
+      the percentages of every resample are one product with the answers.
+      The interval is the percentile interval of the resampled percentages.
+    - Permutation: profiles are shuffled between visitors. For every profile,
+      the statistic is its percentage minus the percentage of everyone else;
+      the two-sided p-value is the share of permutations with a difference
+      at least as large as the observed one.
+
+    Every batch draws from its own stream spawned from `seed`
+    (np.random.SeedSequence), so results do not depend on `max_workers`.
+    Intervals of profiles with a handful of visitors are too narrow to be
+    trusted (a single visitor always resamples to itself); their p-values
+    remain valid.
+
+    Args:
+        df (pd.DataFrame): Survey table with a profile column.
+        question_columns (list): Questions to include.
+        profile_column (str): Column holding the profile of each visitor.
+        n_resamples (int): Bootstrap resamples, and permutations.
+        confidence (float): Coverage of the intervals.
+        seed (int): Seed of the random streams.
+        batch_size (int): Resamples drawn and multiplied at a time.
+        max_workers (int): Threads running batches (the products release the
+            GIL); 1 runs them in order.
+
+    Returns:
+        pd.DataFrame: Columns question, option, profile, ci_low, ci_high and
+        p_value, keyed like the cube.
+    """
+    answers, totals, keys, question_of = _answer_matrices(df, question_columns)
+    codes, profiles = pd.factorize(df[profile_column].astype(str), sort=True)
+    labelled = codes >= 0
+    answers, totals, codes = answers[labelled], totals[labelled], codes[labelled]
+    members = [np.flatnonzero(codes == g) for g in range(len(profiles))]
+
+    def one_vs_rest(membership):
+        """Percentage of each profile minus everyone else's, per membership row."""
+        inside = membership @ answers
+        inside_total = (membership @ totals)[:, question_of]
+        outside = answers.sum(axis=0) - inside
+        outside_total = totals.sum(axis=0)[question_of] - inside_total
+        share = np.divide(
+            inside, inside_total, out=np.zeros_like(inside), where=inside_total > 0
+        )
+        rest = np.divide(
+            outside, outside_total, out=np.zeros_like(outside), where=outside_total > 0
+        )
+        return (share - rest) * 100
+
+    observed = np.stack(
+        [one_vs_rest((codes == g)[None].astype(float))[0] for g in range(len(profiles))]
+    )
+
+    def bootstrap_batch(task):
+        profile, size, stream = task
+        rng = np.random.default_rng(stream)
+        n = len(members[profile])
+        draws = rng.integers(0, n, size=(size, n))
+        # Index matrix -> count matrix: how often each visitor was drawn
+        offsets = draws + n * np.arange(size)[:, None]
+        weights = np.bincount(offsets.ravel(), minlength=size * n).reshape(size, n)
+        rows = members[profile]
+        return _percentages(
+            weights.astype(float), answers[rows], totals[rows], question_of
+        )
+
+    def permutation_batch(task):
+        size, stream = task
+        rng = np.random.default_rng(stream)
+        shuffled = rng.permuted(np.broadcast_to(codes, (size, len(codes))), axis=1)
+        exceed = np.zeros_like(observed)
+        for g in range(len(profiles)):
+            differences = one_vs_rest((shuffled == g).astype(float))
+            exceed[g] += (np.abs(differences) >= np.abs(observed[g]) - 1e-9).sum(axis=0)
+        return exceed
+
+    sizes = [
+        min(batch_size, n_resamples - start)
+        for start in range(0, n_resamples, batch_size)
+    ]
+    streams = iter(np.random.SeedSequence(seed).spawn(len(sizes) * (len(profiles) + 1)))
+    bootstrap_tasks = [
+        [(g, size, next(streams)) for size in sizes] for g in range(len(profiles))
+    ]
+    permutation_tasks = [(size, next(streams)) for size in sizes]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        bounds = []
+        for tasks in bootstrap_tasks:
+            resampled = np.vstack(list(executor.map(bootstrap_batch, tasks)))
+            alpha = (1 - confidence) / 2
+            bounds.append(np.quantile(resampled, [alpha, 1 - alpha], axis=0))
+        exceed = sum(executor.map(permutation_batch, permutation_tasks))
+    p_values = (exceed + 1) / (n_resamples + 1)
+
+    result = pd.concat(
+        [
+            keys.assign(
+                profile=profile,
+                ci_low=bounds[g][0],
+                ci_high=bounds[g][1],
+                p_value=p_values[g],
+            )
+            for g, profile in enumerate(profiles)
+        ],
+        ignore_index=True,
+    )
+    result["question"] = pd.Categorical(result["question"], categories=question_columns)
+    return result
+
+
+#################
+# Associations  #
+#################
+
+from scipy import stats
+
+
+def benjamini_hochberg(p_values):
+    """
+    Benjamini-Hochberg adjusted p-values (false discovery rate). Missing
+    p-values stay missing and do not count as tests.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full_like(p_values, np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    order = tested[np.argsort(p_values[tested])]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    # Monotone from the largest p-value down
+    adjusted[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return adjusted
+
+
+def chi_square_tables(tables):
+    """
+    Pearson chi-square test of independence on a stack of contingency
+    tables (tests x rows x columns), zero padded to a common shape. Rows and
+    columns without any count are left out of the degrees of freedom.
+
+    Returns:
+        dict: Arrays n, dof, chi2, p_value, cramers_v and min_expected, one
+        value per table; tests with less than two non-empty rows or columns
+        get a missing p-value.
+    """
+    tables = np.asarray(tables, dtype=float)
+    n = tables.sum(axis=(1, 2))
+    rows = tables.sum(axis=2)
+    cols = tables.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = rows[:, :, None] * cols[:, None, :] / n[:, None, None]
+        contributions = np.where(expected > 0, (tables - expected) ** 2 / expected, 0.0)
+    chi2 = contributions.sum(axis=(1, 2))
+
+    r = (rows > 0).sum(axis=1)
+    c = (cols > 0).sum(axis=1)
+    dof = (r - 1) * (c - 1)
+    testable = dof > 0
+    p_value = np.where(testable, stats.chi2.sf(chi2, np.maximum(dof, 1)), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cramers_v = np.sqrt(chi2 / (n * (np.minimum(r, c) - 1)))
+    min_expected = np.where(expected > 0, expected, np.inf).min(axis=(1, 2))
+    return {
+        "n": n.astype(int),
+        "dof": dof,
+        "chi2": np.where(testable, chi2, np.nan),
+        "p_value": p_value,
+        "cramers_v": np.where(testable, cramers_v, np.nan),
+        "min_expected": np.where(testable, min_expected, np.nan),
+    }
+
+
+def profile_association_table(df, question_columns, profile_column="profile"):
+    """
+    Ranked chi-square tests of every question against the profile.
+
+    All contingency tables come from one product of the profile membership
+    matrix with the answer matrix (_answer_matrices), and all tests are run
+    at once on the stacked tables (chi_square_tables). Single choice
+    questions give one options x profiles test. Multiselect options are not
+    exclusive, so each option is tested on its own as selected / not
+    selected x profiles, among the visitors who answered the question.
+    p-values are adjusted over all tests (benjamini_hochberg).
+
+    Args:
+        df (pd.DataFrame): Survey table with a profile column.
+        question_columns (list): Questions to test.
+        profile_column (str): Column holding the profile of each visitor.
+
+    Returns:
+        pd.DataFrame: Columns question, option (multiselect tests only), n,
+        dof, chi2, p_value, p_adjusted, cramers_v and min_expected, sorted
+        by adjusted p-value and then by effect size.
+    """
+    answers, totals, keys, question_of = _answer_matrices(df, question_columns)
+    codes, profiles = pd.factorize(df[profile_column].astype(str), sort=True)
+    membership = np.zeros((len(df), len(profiles)))
+    membership[np.flatnonzero(codes >= 0), codes[codes >= 0]] = 1
+
+    # One grouped pass: profiles x (question, option) and profiles x question
+    counts = membership.T @ answers
+    respondents = membership.T @ (totals > 0)
+
+    tests, tables = [], []
+    for position, question in enumerate(question_columns):
+        columns = np.flatnonzero(question_of == position)
+        if _is_list_column(df[question]):
+            for column in columns:
+                selected = counts[:, column]
+                tables.append(
+                    np.column_stack([selected, respondents[:, position] - selected])
+                )
+                tests.append((question, keys["option"].iloc[column]))
+        else:
+            tables.append(counts[:, columns])
+            tests.append((question, None))
+
+    width = max((table.shape[1] for table in tables), default=1)
+    stacked = np.zeros((len(tables), len(profiles), width))
+    for i, table in enumerate(tables):
+        stacked[i, :, : table.shape[1]] = table
+
+    result = pd.DataFrame(tests, columns=["question", "option"]).assign(
+        **chi_square_tables(stacked)
+    )
+    result["p_adjusted"] = benjamini_hochberg(result["p_value"])
+    result = result[
+        ["question", "option", "n", "dof", "chi2", "p_value", "p_adjusted"]
+        + ["cramers_v", "min_expected"]
+    ]
+    return result.sort_values(
+        ["p_adjusted", "cramers_v"], ascending=[True, False], ignore_index=True
+    )
+
+
+#################
+#    Schema     #
+#################
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def apply_survey_schema(df, schema, scales):
+    """
+    Casts the survey columns to the types declared in survey_schema.yaml.
+
+    Single choice answers become categoricals (ordered for scale questions),
+    multiselect answers become lists of options, numeric answers become
+    floats and free text becomes strings. Values outside a scale, or that are
+    not numbers in a numeric column, become missing. Columns without a
+    declared type are left as they are.
+
+    Args:
+        df (pd.DataFrame): Processed survey table.
+        schema (dict): Column -> {"type", "scale"} (survey_schema.yaml).
+        scales (dict): Scale name -> ordered options (survey_schema.yaml).
+
+    Returns:
+        pd.DataFrame: Typed copy of the table.
+    """
+    typed = df.copy()
+    for col, spec in schema.items():
+        if col not in typed:
+            continue
+        kind = spec["type"]
+        if kind == "category":
+            typed[col] = typed[col].astype("string").astype("category")
+        elif kind == "ordinal":
+            typed[col] = pd.Categorical(
+                typed[col], categories=scales[spec["scale"]], ordered=True
+            )
+        elif kind == "multiselect":
+            typed[col] = split_multiselect(typed[col])
+        elif kind == "numeric":
+            typed[col] = pd.to_numeric(typed[col], errors="coerce")
+        elif kind == "text":
+            typed[col] = typed[col].astype("string")
+        else:
+            raise ValueError(f"Unknown column type '{kind}' for {col}")
+    return typed
+
+
+def survey_arrow_schema(df, schema):
+    """Arrow schema of a typed survey table, with dictionary encoded choices."""
+    fields = [pa.field(df.index.name or "visitor_id", pa.string())]
+    for col in df.columns:
+        kind = schema.get(col, {}).get("type")
+        if kind in ("category", "ordinal"):
+            arrow_type = pa.dictionary(
+                pa.int32(), pa.string(), ordered=kind == "ordinal"
+            )
+        elif kind == "multiselect":
+            arrow_type = pa.list_(pa.string())
+        elif kind == "numeric":
+            arrow_type = pa.float64()
+        elif kind == "text":
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.Schema.from_pandas(df[[col]], preserve_index=False)[0].type
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+def write_survey_parquet(df, path, schema):
+    """Writes a typed survey table (apply_survey_schema) with its Arrow schema."""
+    df = df.copy()
+    df.index = df.index.astype(str).rename(df.index.name or "visitor_id")
+    table = pa.Table.from_pandas(
+        df, schema=survey_arrow_schema(df, schema), preserve_index=True
+    )
+    pq.write_table(table, path)
+
+
+def load_survey_parquet(path, columns=None):
+    """
+    Loads a typed survey table: categoricals come back as categoricals and
+    multiselect columns as lists, so nothing needs to be parsed again.
+    """
+    df = pd.read_parquet(path, columns=columns)
+    list_columns = [
+        field.name
+        for field in pq.read_schema(path)
+        if pa.types.is_list(field.type) and field.name in df
+    ]
+    for col in list_columns:
+        df[col] = df[col].map(list, na_action="ignore")
+    return df
+
+
+#################
+#    Scoring    #
+#################
+
+
+def likert_codes(df, items, reverse=()):
+    """
+    Likert answers as int8 ordinal codes: 1 for the first option of the scale
+    up to the number of options, 0 for no answer. Reverse-keyed items are
+    flipped (1 <-> 5 on a five point scale), so a higher code always means a
+    stronger positive response.
+
+    Args:
+        df (pd.DataFrame): Typed survey table (apply_survey_schema), where
+            the items are ordered categoricals.
+        items (list): Likert columns.
+        reverse (list): Items to reverse-key.
+
+    Returns:
+        pd.DataFrame: int8 codes, one column per item, same index as df.
+    """
+    for col in items:
+        if not (isinstance(df[col].dtype, pd.CategoricalDtype) and df[col].cat.ordered):
+            raise ValueError(f"{col} is not an ordinal column, see apply_survey_schema")
+
+    # Categorical codes are -1 for missing, 0 for the first option
+    codes = np.column_stack([df[col].cat.codes.to_numpy() for col in items]) + 1
+    codes = codes.astype(np.int8)
+    points = np.array([len(df[col].cat.categories) for col in items], dtype=np.int8)
+    flip = np.isin(items, list(reverse)) & (codes > 0)
+    codes = np.where(flip, points + 1 - codes, codes).astype(np.int8)
+    return pd.DataFrame(codes, index=df.index, columns=items)
+
+
+def likert_scale_scores(codes, likert_scales, min_answered=0.5):
+    """
+    Score of every visitor on every scale: the mean code of the answered
+    items, or missing when fewer than `min_answered` of the items are
+    answered.
+
+    Args:
+        codes (pd.DataFrame): likert_codes of every item of the scales.
+        likert_scales (dict): Scale -> {"items", "reverse"} (survey_schema.yaml).
+        min_answered (float): Fraction of the items a visitor must answer.
+
+    Returns:
+        pd.DataFrame: One float column per scale.
+    """
+    scores = {}
+    for scale, spec in likert_scales.items():
+        values = codes[spec["items"]].to_numpy()
+        answered = (values > 0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = values.sum(axis=1) / answered
+        scores[scale] = np.where(
+            answered >= min_answered * len(spec["items"]), mean, np.nan
+        )
+    return pd.DataFrame(scores, index=codes.index)
+
+
+def cronbach_alpha(codes, groups):
+    """
+    Cronbach's alpha of a set of items within every group:
+
+        alpha = k / (k - 1) * (1 - sum of item variances / variance of the sum)
+
+    computed on the visitors who answered every item (listwise deletion).
+
+    Args:
+        codes (pd.DataFrame): likert_codes of the items of one scale.
+        groups (pd.Series): Group of every visitor (e.g. profile).
+
+    Returns:
+        pd.DataFrame: Columns n (complete answers) and alpha, one row per
+        group; alpha is missing with fewer than two complete answers or when
+        everyone in the group gave the same answers.
+    """
+    complete = (codes > 0).all(axis=1)
+    values = codes[complete].astype(float)
+    groups = groups[complete]
+    k = codes.shape[1]
+
+    item_variance = values.groupby(groups, observed=True).var().sum(axis=1)
+    total_variance = values.sum(axis=1).groupby(groups, observed=True).var()
+    n = values.groupby(groups, observed=True).size()
+    alpha = k / (k - 1) * (1 - item_variance / total_variance)
+    alpha = alpha.where((n >= 2) & (total_variance > 0))
+    return pd.DataFrame({"n": n, "alpha": alpha})
+
+
+def likert_scale_summary(codes, scores, likert_scales, groups, total="All"):
+    """
+    Mean, standard deviation and Cronbach's alpha of every scale per group,
+    plus a `total` row over everyone.
+
+    Args:
+        codes (pd.DataFrame): likert_codes of every item of the scales.
+        scores (pd.DataFrame): likert_scale_scores.
+        likert_scales (dict): Scale -> {"items", "reverse"} (survey_schema.yaml).
+        groups (pd.Series): Group of every visitor (e.g. profile).
+        total (str): Label of the row over all visitors.
+
+    Returns:
+        pd.DataFrame: Columns scale, group, items, visitors (with a score),
+        mean, std, n_complete and alpha.
     """
+    groups = groups.astype("string")
+    everyone = pd.Series(total, index=groups.index, dtype="string")
+    tables = []
+    for scale, spec in likert_scales.items():
+        for by in (groups, everyone):
+            stats = (
+                scores[scale]
+                .groupby(by)
+                .agg(visitors="count", mean="mean", std="std")
+                .join(cronbach_alpha(codes[spec["items"]], by))
+                .rename(columns={"n": "n_complete"})
+            )
+            stats.insert(0, "items", len(spec["items"]))
+            stats.insert(0, "scale", scale)
+            tables.append(stats.rename_axis("group").reset_index())
+    summary = pd.concat(tables, ignore_index=True)
+    summary["n_complete"] = summary["n_complete"].fillna(0).astype(int)
+    return summary[
+        ["scale", "group", "items", "visitors", "mean", "std", "n_complete", "alpha"]
+    ]
 
-    # List all files in folder
-    json_files = match_files(data_dir, pattern)
 
-    # List of python objects
-    data = [load_json(file_path) for file_path in json_files if file_path]
+#################
+# Interactions  #
+#################
 
-    return data
+import itertools
 
 
-def extract_id(filename):
-    """Extracts the numeric ID from the filename."""
-    match = re.search(r"_(\d+)\.json$", filename)
-    return match.group(1) if match else None
+def index_log_files(data_dir, pattern="Log_*.json"):
+    """
+    Index of every log file in a directory by visitor ID and log type.
 
+    The kiosk writes one file per visitor and log type, named
+    <log type>_<visitor ID>.json (e.g. Log_Survey_BB_1732891230278.json), so
+    the type is whatever precedes the ID (extract_id). The directory is
+    listed once (iter_survey_files); no file is opened.
 
-def extract_id_files(data_dir, pattern="Log_Survey_BB_*.json"):
+    Returns:
+        pd.DataFrame: Columns id, log_type, path, size and mtime (ns), one row
+        per file.
     """
-    Extracts numeric IDs from filenames matching a given pattern.
+    rows = [
+        (
+            visitor_id,
+            os.path.basename(path)[: -len(f"_{visitor_id}.json")],
+            path,
+            st.st_size,
+            st.st_mtime_ns,
+        )
+        for visitor_id, path, st in iter_survey_files(data_dir, pattern)
+    ]
+    return pd.DataFrame(rows, columns=["id", "log_type", "path", "size", "mtime"])
 
-    Args:
-        data_dir (str): Path to the directory containing files.
-        pattern (str): Filename pattern to match (default: 'Log_Survey_BB_*.json').
 
-    Returns:
-        list: A list of extracted numeric IDs as strings.
+def iter_json_records(path, events_key=None, chunk_size=1 << 16):
     """
+    Yields the records of a JSON log one at a time, without loading the file.
 
-    # List all matching files
-    files = match_files(data_dir, pattern)
+    The file is read in chunks and every record is decoded with
+    json.JSONDecoder.raw_decode as soon as it is complete, so memory holds a
+    chunk and the record being decoded whatever the size of the log. The log
+    is either a list of records or an object whose `events_key` holds that
+    list (the first occurrence of the key is taken; the rest of the object
+    is skipped).
 
-    # Extract IDs and filter out None values
-    ids = [extract_id(file) for file in files]
+    Args:
+        path (str): JSON log.
+        events_key (str): Key of the record list when the log is an object.
+        chunk_size (int): Characters read at a time.
 
-    return ids
+    Yields:
+        Each element of the record list, as decoded by json.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, pos = "", 0
+
+        def read_more():
+            """Appends a chunk to what is left of the buffer; False at the end."""
+            nonlocal buffer, pos
+            chunk = f.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            return bool(chunk)
+
+        def skip(separators=""):
+            """Next character that is not whitespace or a separator ("" at the end)."""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and (
+                    buffer[pos].isspace() or buffer[pos] in separators
+                ):
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not read_more():
+                    return ""
+
+        start = skip()
+        if start == "{" and events_key is not None:
+            key = re.compile(r'"%s"\s*:\s*\[' % re.escape(events_key))
+            while (match := key.search(buffer, pos)) is None:
+                # Keep enough of the tail for a key split between chunks
+                pos = max(pos, len(buffer) - len(events_key) - 64)
+                if not read_more():
+                    return
+            pos = match.end()
+        elif start == "[":
+            pos += 1
+        else:
+            if start:
+                print(f"Not a list of records: {path}")
+            return
 
+        while skip(",") not in ("]", ""):
+            while True:
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if read_more():
+                        continue  # Record split between chunks
+                    print(f"Error decoding JSON in file: {path}")
+                    print(e)
+                    return
+                # A number cut at the end of a chunk decodes as a shorter one,
+                # so a record only counts once the separator after it is read
+                follow = end
+                while follow < len(buffer) and buffer[follow].isspace():
+                    follow += 1
+                if (
+                    follow == len(buffer) or buffer[follow] not in ",]"
+                ) and read_more():
+                    continue
+                break
+            if follow == len(buffer) and type(record) in (int, float):
+                # Truncated log ending in a number that may itself be cut
+                print(f"Incomplete last record in file: {path}")
+                return
+            pos = end
+            yield record
+
+
+def _event_times(values, unit):
+    """Event timestamps as datetime64: epoch numbers in `unit`, or date strings."""
+    numeric = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    if numeric.notna().any():
+        return pd.to_datetime(numeric, unit=unit).to_numpy()
+    return pd.to_datetime(pd.Series(values), errors="coerce").to_numpy()
+
+
+def fold_interaction_events(aggregates, visitor_id, events, fields, unit="ms"):
+    """
+    Folds one batch of a visitor's events into the running aggregates.
 
-def str_to_list(string):
-    if pd.isna(string):
-        return []
-    return string.split(sep="__")
+    Events are sorted by time; the time until the next event is the dwell of
+    the scene the earlier event happened in. Only counters, the first and
+    last timestamps, the set of hotspots, the dwell per scene and the latest
+    event are kept, so the events themselves can be dropped after every
+    batch. The latest event carries the dwell over to the next batch, which
+    assumes batches come in time order, as they do when reading a log that
+    is appended to from start to end; a batch starting before the previous
+    one ended marks the aggregate "unordered".
+
+    Args:
+        aggregates (dict): visitor ID -> running aggregate, updated in place.
+        visitor_id (str): Visitor the events belong to.
+        events (list): Event dicts.
+        fields (dict): Keys of the timestamp, scene and hotspot of an event.
+        unit (str): Unit of numeric timestamps.
+    """
+    events = [event for event in events if isinstance(event, dict)]
+    agg = aggregates.setdefault(
+        visitor_id,
+        {
+            "events": 0,
+            "first": None,
+            "last": None,
+            "hotspots": set(),
+            "dwell": {},
+            "tail": None,
+        },
+    )
+    if not events:
+        return agg
+
+    times = _event_times([e.get(fields["timestamp"]) for e in events], unit)
+    valid = ~np.isnat(times)
+    order = np.argsort(times[valid], kind="stable")
+    times = times[valid][order]
+    scenes = np.array([e.get(fields["scene"]) for e in events], dtype=object)
+    scenes = scenes[valid][order]
+
+    agg["events"] += len(events)
+    agg["hotspots"].update(
+        e[fields["hotspot"]] for e in events if e.get(fields["hotspot"]) is not None
+    )
+    if len(times):
+        first, last = times[0], times[-1]
+        agg["first"] = first if agg["first"] is None else min(agg["first"], first)
+        agg["last"] = last if agg["last"] is None else max(agg["last"], last)
+
+        # The previous batch's latest event dwells until this batch's first
+        tail = agg.get("tail")
+        if tail is not None and first < tail[0]:
+            agg["unordered"] = True
+        if tail is not None and tail[0] <= first:
+            times = np.concatenate([[tail[0]], times])
+            scenes = np.concatenate([np.array([tail[1]], dtype=object), scenes])
+        if tail is None or tail[0] <= last:
+            agg["tail"] = (last, scenes[-1])
+
+        # Dwell: gap to the next event, credited to the current scene
+        gaps = np.diff(times).astype("timedelta64[ms]").astype(float) / 1000
+        codes, uniques = pd.factorize(scenes[:-1])
+        dwell = np.bincount(codes[codes >= 0], weights=gaps[codes >= 0])
+        for scene, seconds in zip(uniques, dwell):
+            agg["dwell"][scene] = agg["dwell"].get(scene, 0.0) + seconds
+    return agg
+
+
+def _merge_aggregate(total, agg):
+    """Adds one log's aggregate to a visitor's (no dwell between the logs)."""
+    if total is None:
+        return {**agg, "hotspots": set(agg["hotspots"]), "dwell": dict(agg["dwell"])}
+    total["events"] += agg["events"]
+    for key, pick in (("first", min), ("last", max)):
+        if agg[key] is not None:
+            total[key] = agg[key] if total[key] is None else pick(total[key], agg[key])
+    total["hotspots"] |= agg["hotspots"]
+    for scene, seconds in agg["dwell"].items():
+        total["dwell"][scene] = total["dwell"].get(scene, 0.0) + seconds
+    return total
+
+
+def _aggregate_to_json(agg):
+    """JSON form of a finished aggregate; timestamps as epoch nanoseconds."""
+
+    def epoch_ns(value):
+        return None if value is None else int(value.astype("datetime64[ns]").view("i8"))
+
+    return {
+        "events": agg["events"],
+        "first": epoch_ns(agg["first"]),
+        "last": epoch_ns(agg["last"]),
+        "hotspots": list(agg["hotspots"]),
+        # Pairs rather than an object: scenes need not be strings
+        "dwell": [[scene, seconds] for scene, seconds in agg["dwell"].items()],
+    }
+
+
+def _aggregate_from_json(data):
+    def timestamp(value):
+        return None if value is None else np.datetime64(value, "ns")
+
+    return {
+        "events": data["events"],
+        "first": timestamp(data["first"]),
+        "last": timestamp(data["last"]),
+        "hotspots": set(data["hotspots"]),
+        "dwell": {scene: seconds for scene, seconds in data["dwell"]},
+        "tail": None,
+    }
+
+
+def _load_interaction_checkpoint(checkpoint_path):
+    """
+    Entries of a JSON-lines checkpoint by log path; a later line for the same
+    log wins. A line cut short by a crash is ignored (that log is read again).
+    """
+    entries = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["path"]] = entry
+    return entries
 
 
-def visitor_profile(df):
+def _save_interaction_checkpoint(entries, checkpoint_path):
+    """
+    Compacts the checkpoint to one line per log, through a temporary file so
+    a crash never leaves half a checkpoint.
+    """
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries.values():
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, checkpoint_path)
 
-    research_education_level = ["Bachelor's degree", "Master's degree", "Doctorate"]
 
-    df["profile"] = False
-    df["profile"] = df["profile"].case_when(
-        caselist=[
-            ((df["visit_type"] == "As a student with my group"), "Student"),
-            ((df["personal_connection_nazi_history"] == "Yes"), "Personal Involvement"),
-            (
-                (df["visit_purpose"].str.contains("For research", na=False))
-                & (df["education_level"].isin(research_education_level)),
-                "Researcher",
+def interaction_table(aggregates):
+    """
+    One row per visitor from the running aggregates: number of events,
+    first and last event, session length and hotspots visited (in seconds
+    and counts), and one dwell_<scene> column per scene.
+    """
+    visitor_ids = pd.Index(list(aggregates), name="visitor_id", dtype=str)
+    table = pd.DataFrame(
+        {
+            "events": [agg["events"] for agg in aggregates.values()],
+            "session_start": pd.to_datetime(
+                [agg["first"] for agg in aggregates.values()]
             ),
-            ((pd.Series(True, index=df.index)), "Tourist"),
-        ]
+            "session_end": pd.to_datetime([agg["last"] for agg in aggregates.values()]),
+            "hotspots_visited": [len(agg["hotspots"]) for agg in aggregates.values()],
+        },
+        index=visitor_ids,
     )
-    return df
+    table["session_length_s"] = (
+        table["session_end"] - table["session_start"]
+    ).dt.total_seconds()
+    dwell = pd.DataFrame(
+        [agg["dwell"] for agg in aggregates.values()], index=visitor_ids
+    ).fillna(0.0)
+    dwell = dwell[sorted(dwell.columns, key=str)].add_prefix("dwell_")
+    return table.join(dwell)
+
+
+def aggregate_interactions(
+    log_index,
+    log_types,
+    fields,
+    unit="ms",
+    events_key=None,
+    checkpoint_path=None,
+    checkpoint_every=100,
+    batch_size=10_000,
+    chunk_size=1 << 16,
+):
+    """
+    Streams the interaction logs into per-visitor aggregates with bounded
+    memory: records are decoded lazily (iter_json_records) and folded in
+    batches (fold_interaction_events), so memory holds one batch and the
+    aggregates, never a whole log.
+
+    With a checkpoint, the aggregate of every finished log is saved with the
+    size and mtime of its file. The checkpoint is a JSON-lines file: each
+    finished log appends one line (flushed every `checkpoint_every` logs and
+    on exit, including errors), so writing it costs the same per log however
+    large the archive. It is compacted to one line per current log when a
+    run starts. A restarted run only reads logs that are new, changed or
+    were not finished; aggregates of deleted logs are dropped.
+
+    Args:
+        log_index (pd.DataFrame): index_log_files output.
+        log_types (list): Log types holding interaction events.
+        fields (dict): Keys of the timestamp, scene and hotspot of an event.
+        unit (str): Unit of numeric timestamps.
+        events_key (str): Key of the event list when a file is a JSON object
+            rather than a list of events.
+        checkpoint_path (str): JSON-lines file of per-log aggregates (optional).
+        checkpoint_every (int): Logs read between checkpoint flushes.
+        batch_size (int): Events folded at a time.
+        chunk_size (int): Characters read from a log at a time.
+
+    Returns:
+        pd.DataFrame: interaction_table of every visitor with a log.
+    """
+    logs = log_index[log_index["log_type"].isin(log_types)]
+    # Forget logs that are gone; changed ones are recognized by size and mtime
+    current = set(logs["path"])
+    entries = {
+        path: entry
+        for path, entry in _load_interaction_checkpoint(checkpoint_path).items()
+        if path in current
+    }
+    journal = None
+    if checkpoint_path:
+        # Drops deleted logs, lines superseded by a later one and any cut line
+        _save_interaction_checkpoint(entries, checkpoint_path)
+        journal = open(checkpoint_path, "a", encoding="utf-8")
+
+    read = 0
+    try:
+        for visitor_id, path, size, mtime in zip(
+            logs["id"], logs["path"], logs["size"], logs["mtime"]
+        ):
+            entry = entries.get(path)
+            if entry and (entry["size"], entry["mtime"]) == (size, mtime):
+                continue
+
+            aggregates = {}
+            records = iter_json_records(path, events_key, chunk_size)
+            while batch := list(itertools.islice(records, batch_size)):
+                fold_interaction_events(aggregates, visitor_id, batch, fields, unit)
+            if visitor_id not in aggregates:
+                fold_interaction_events(aggregates, visitor_id, [], fields, unit)
+            if aggregates[visitor_id].get("unordered"):
+                print(f"Events out of time order, dwell times approximate: {path}")
+            entries[path] = {
+                "path": path,
+                "id": visitor_id,
+                "size": int(size),
+                "mtime": int(mtime),
+                "aggregate": _aggregate_to_json(aggregates[visitor_id]),
+            }
+            read += 1
+            if journal:
+                journal.write(json.dumps(entries[path]) + "\n")
+                if read % checkpoint_every == 0:
+                    journal.flush()
+    finally:
+        if journal:
+            journal.close()
+
+    print(
+        f"Interaction logs: {read} read, "
+        f"{len(entries) - read} unchanged since the checkpoint"
+    )
+    visitors = {}
+    for entry in entries.values():
+        visitors[entry["id"]] = _merge_aggregate(
+            visitors.get(entry["id"]), _aggregate_from_json(entry["aggregate"])
+        )
+    return interaction_table(visitors)
+
+
+def join_interactions(df_survey, interactions):
+    """
+    Survey answers with the interaction aggregates of the same visitors.
+    Visitors without logs keep their answers with missing aggregates.
+    """
+    df_survey = df_survey.set_axis(df_survey.index.astype(str))
+    return df_survey.join(interactions, how="left")
 
 
 #################
@@ -122,6 +1988,7 @@ from datetime import datetime
 from pathlib import Path
 from urllib.request import pathname2url
 
+import numpy as np
 import pandas as pd
 from IPython.display import HTML, display
 
@@ -148,6 +2015,119 @@ def clean_duplicated_json(data_dir, pattern):
     print("Finished processing and deleting matching files.")
 
 
+def find_test_submissions(df, value="Test", exact_match=False):
+    """
+    Visitors with a test answer in any column.
+
+    Each column is factorized and only its distinct values are tested, then
+    the result is spread back to the rows through the codes, so free text
+    columns are not scanned row by row.
+
+    Args:
+        df (pd.DataFrame): Survey table, indexed by visitor ID.
+        value (str): Marker of test entries ("Test" after mapping_response.yaml).
+        exact_match (bool): Match the whole answer instead of any
+            case-insensitive occurrence of value.
+
+    Returns:
+        pd.Series: Matched columns ("; "-joined), indexed by the visitor IDs
+        of the test submissions.
+    """
+    hits = {}
+    for col in df.columns:
+        values = df[col]
+        if _is_list_column(values):
+            values = values.map("__".join, na_action="ignore")
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype="string")
+        if exact_match:
+            matched = uniques.eq(value)
+        else:
+            matched = uniques.str.contains(value, case=False, regex=False)
+        matched = np.append(matched.fillna(False).to_numpy(bool), False)
+        if matched.any():
+            hits[col] = matched[codes]  # Code -1 (missing) picks the final False
+
+    mask = pd.DataFrame(hits, index=df.index.astype(str))
+    if mask.empty or not mask.to_numpy().any():
+        return pd.Series(index=pd.Index([], dtype=str), dtype=str, name="columns")
+    matches = mask.stack()
+    matches = matches[matches]
+    columns = matches.reset_index(level=1).iloc[:, 0]
+    return columns.groupby(level=0, sort=False).agg("; ".join).rename("columns")
+
+
+def purge_test_submissions(
+    df,
+    data_dir,
+    pattern="Log_Survey*.json",
+    quarantine_path=None,
+    dry_run=True,
+    value="Test",
+    exact_match=False,
+):
+    """
+    Finds the log files of test submissions and, unless dry_run, deletes them.
+
+    Files are matched to visitors through an exact ID -> paths index built
+    from the filenames (iter_survey_files), so visitor "12" never matches
+    Log_Survey_BB_123.json, while every file with ID 12 does. The list of
+    matched files is written to
+    quarantine_path (CSV) when given, before anything is deleted, so a dry run
+    can be reviewed first.
+
+    Args:
+        df (pd.DataFrame): Survey table, indexed by visitor ID.
+        data_dir (str): Directory of the survey logs.
+        pattern (str): Filename pattern of the logs.
+        quarantine_path (str): CSV to write the matches to (id, path, columns).
+        dry_run (bool): Only list the files, delete nothing.
+        value (str): Marker of test entries.
+        exact_match (bool): See find_test_submissions.
+
+    Returns:
+        pd.DataFrame: One row per matched file (one row with a missing path
+        for a test submission without files): id, path, matched columns and
+        whether the file was removed.
+    """
+    test_columns = find_test_submissions(df, value, exact_match)
+    # Several files can share an ID (e.g. the survey and interaction logs of
+    # one visitor with a broad pattern): every one of them is listed
+    files = {}
+    for visitor_id, path, _ in iter_survey_files(data_dir, pattern):
+        if visitor_id in test_columns.index:
+            files.setdefault(visitor_id, []).append(path)
+
+    quarantine = pd.DataFrame(
+        {
+            "id": test_columns.index,
+            "path": [sorted(files.get(i, [])) or [np.nan] for i in test_columns.index],
+            "columns": test_columns.to_numpy(),
+            "removed": False,
+        }
+    )
+    quarantine = quarantine.explode("path", ignore_index=True)
+    if quarantine_path is not None:
+        quarantine.to_csv(quarantine_path, index=False)
+
+    if not dry_run:
+        for row in quarantine.dropna(subset=["path"]).itertuples():
+            try:
+                os.remove(row.path)
+                quarantine.loc[row.Index, "removed"] = True
+            except OSError as e:
+                print(f"Failed to remove {row.path}: {e}")
+
+    n_files = quarantine["path"].notna().sum()
+    action = "would be removed" if dry_run else f"removed {quarantine['removed'].sum()}"
+    print(
+        f"{quarantine['id'].nunique()} test submissions, {n_files} files found, "
+        f"{action}"
+        + (f" (list: {quarantine_path})" if quarantine_path is not None else "")
+    )
+    return quarantine
+
+
 def remove_json_files_with_test_value_from_index(
     df: pd.DataFrame, directory: str, exact_match: bool = False
 ):
@@ -156,34 +2136,19 @@ def remove_json_files_with_test_value_from_index(
     in the DataFrame index, where the corresponding row contains 'Test'
     in any column.
 
+    Kept for existing callers: deletes right away, see purge_test_submissions
+    for a dry run and a quarantine list.
+
     Parameters:
         df (pd.DataFrame): The DataFrame (IDs must be in the index).
         directory (str): Path to the directory containing JSON files.
         exact_match (bool): Whether to match exact value "Test" or allow partial.
     """
-    # Step 1: Identify rows where any column contains "Test"
-    if exact_match:
-        mask = df.isin(["Test"])
-    else:
-        mask = df.astype(str).apply(
-            lambda row: row.str.contains("Test", case=False, na=False), axis=1
-        )
-
-    matching_ids = df.index[mask.any(axis=1)].astype(str).tolist()
-
-    # Step 2: Delete matching files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".json"):
-            continue
-        for file_id in matching_ids:
-            if re.search(rf"{re.escape(file_id)}", filename):
-                file_path = os.path.join(directory, filename)
-                try:
-                    os.remove(file_path)
-                    print(f"Removed: {file_path}")
-                except Exception as e:
-                    print(f"Failed to remove {file_path}: {e}")
-                break  # Avoid multiple deletions for same file
+    quarantine = purge_test_submissions(
+        df, directory, pattern="*.json", dry_run=False, exact_match=exact_match
+    )
+    for path in quarantine.loc[quarantine["removed"], "path"]:
+        print(f"Removed: {path}")
 
 
 #################
@@ -191,6 +2156,7 @@ def remove_json_files_with_test_value_from_index(
 #################
 
 import base64
+from html import escape
 
 
 def embed_image_base64(path, caption=None, alt_text=None, width="100%"):
@@ -223,61 +2189,85 @@ def embed_image_base64(path, caption=None, alt_text=None, width="100%"):
 
 
 def generate_columnwise_unique_report(
-    df: pd.DataFrame, output_path: str = "unique_values_columnwise.html"
+    df: pd.DataFrame,
+    output_path: str = "unique_values_columnwise.html",
+    max_values: int = 200,
 ) -> str:
-    # Collect unique values per column
-    unique_values = {col: df[col].dropna().unique().tolist() for col in df.columns}
-
-    # Start HTML
-    html = """
-    <html>
-    <head>
-        <style>
-            body { font-family: Arial; padding: 20px; }
-            table { border-collapse: collapse; }
-            td, th { border: 1px solid #ddd; padding: 8px; vertical-align: top; text-align: left; }
-            th { background-color: #f2f2f2; }
-            button { margin: 10px 0; padding: 6px 10px; background-color: #4CAF50; color: white; border: none; cursor: pointer; }
-            button:hover { background-color: #45a049; }
-            pre { background: #f8f8f8; padding: 10px; border: 1px solid #ccc; }
-        </style>
-        <script>
-            function copyText(id) {
-                var text = document.getElementById(id).innerText;
-                navigator.clipboard.writeText(text).then(function() {
-                    alert("Copied to clipboard!");
-                }, function(err) {
-                    alert("Failed to copy text: ", err);
-                });
-            }
-        </script>
-    </head>
-    <body>
-        <h1>Unique Values Per Column</h1>
-        <table>
-            <tr><th>Column</th><th>Unique Values</th><th>Copy</th></tr>
     """
-
-    for i, (col, values) in enumerate(unique_values.items()):
-        text_block = "\n".join(str(v) for v in values)
-        pre_id = f"pre_{i}"
-        html += f"""
-            <tr>
-                <td><b>{col}</b></td>
-                <td><pre id="{pre_id}">{text_block}</pre></td>
-                <td><button onclick="copyText('{pre_id}')">Copy</button></td>
-            </tr>
-        """
-
-    html += """
-        </table>
-    </body>
-    </html>
+    Writes an HTML table of the distinct values of every column with their
+    counts, most frequent first.
+
+    The file is written column by column, so only one column's counts are in
+    memory at a time. Values are HTML escaped. Columns with more than
+    max_values distinct values (free text) are cut off with a note of how many
+    values and answers were left out; None shows them all. The Copy button
+    copies the listed values, one per line.
     """
+    head = """<html>
+<head>
+    <meta charset="UTF-8">
+    <style>
+        body { font-family: Arial; padding: 20px; }
+        table { border-collapse: collapse; }
+        td, th { border: 1px solid #ddd; padding: 8px; vertical-align: top; text-align: left; }
+        th { background-color: #f2f2f2; }
+        table table td { border: none; padding: 1px 8px; font-family: monospace; white-space: pre-wrap; }
+        td.count { color: #888; text-align: right; }
+        td.more { color: #888; font-style: italic; }
+        button { margin: 10px 0; padding: 6px 10px; background-color: #4CAF50; color: white; border: none; cursor: pointer; }
+        button:hover { background-color: #45a049; }
+    </style>
+    <script>
+        function copyText(id) {
+            var cells = document.querySelectorAll("#" + id + " td.value");
+            var text = Array.from(cells, function (cell) { return cell.innerText; }).join("\\n");
+            navigator.clipboard.writeText(text).then(function() {
+                alert("Copied to clipboard!");
+            }, function(err) {
+                alert("Failed to copy text: ", err);
+            });
+        }
+    </script>
+</head>
+<body>
+    <h1>Unique Values Per Column</h1>
+    <table>
+        <tr><th>Column</th><th>Unique Values</th><th>Copy</th></tr>
+"""
 
-    # Write to file
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html)
+        f.write(head)
+
+        for i, col in enumerate(df.columns):
+            values = df[col]
+            if _is_list_column(values):
+                values = values.explode()
+            counts = values.value_counts(dropna=True)
+            # Categoricals list every category; only answers given are shown
+            counts = counts[counts > 0]
+            shown = counts if max_values is None else counts.iloc[:max_values]
+
+            table_id = f"values_{i}"
+            f.write(f"        <tr>\n            <td><b>{escape(str(col))}</b></td>\n")
+            f.write(f'            <td><table id="{table_id}">\n')
+            f.writelines(
+                f'<tr><td class="count">{count}</td>'
+                f'<td class="value">{escape(str(value))}</td></tr>\n'
+                for value, count in shown.items()
+            )
+            if len(shown) < len(counts):
+                hidden = counts.iloc[len(shown) :]
+                f.write(
+                    f'<tr><td></td><td class="more">… {len(hidden)} more values '
+                    f"({hidden.sum()} answers)</td></tr>\n"
+                )
+            f.write("            </table></td>\n")
+            f.write(
+                f"            <td><button onclick=\"copyText('{table_id}')\">Copy"
+                "</button></td>\n        </tr>\n"
+            )
+
+        f.write("    </table>\n</body>\n</html>\n")
 
     return output_path
 
@@ -322,65 +2312,127 @@ def render_mapping_dict_to_html(
     print(f"{output_path}")
 
 
-import re
-from pathlib import Path
-
-from bs4 import BeautifulSoup
-
-
-def combine_html(file_info, output_path="combined_tabs.html"):
+def render_association_table_html(
+    table,
+    output_path="reports/profile_associations.html",
+    title="Answers that differ by profile",
+    alpha=0.05,
+):
     """
-    Combine multiple HTML files into one fullscreen tabbed HTML page, preserving styles.
-
-    Parameters:
-    - file_info: List of tuples (filepath, tab_name)
-    - output_path: Path to save the combined HTML output
+    Writes the ranked tests of profile_association_table as an HTML page
+    that can be a tab of combine_html. Rows significant at `alpha` after the
+    false discovery rate adjustment are highlighted; rows with an expected
+    count below 5 are flagged, as the chi-square approximation is poor there.
     """
-    contents = []
-    styles = []
-    tab_ids = []
+    significant = int((table["p_adjusted"] < alpha).sum())
+    rows = []
+    for i, row in enumerate(table.itertuples(index=False), start=1):
+        classes = []
+        if row.p_adjusted < alpha:
+            classes.append("significant")
+        if row.min_expected < 5:
+            classes.append("sparse")
+        option = "" if pd.isna(row.option) else escape(str(row.option))
+        cells = [
+            str(i),
+            escape(str(row.question)),
+            option,
+            str(row.n),
+            str(row.dof),
+            f"{row.chi2:.2f}",
+            f"{row.p_value:.3g}",
+            f"{row.p_adjusted:.3g}",
+            f"{row.cramers_v:.2f}",
+            f"{row.min_expected:.1f}",
+        ]
+        rows.append(
+            f'<tr class="{" ".join(classes)}">'
+            + "".join(f"<td>{cell}</td>" for cell in cells)
+            + "</tr>"
+        )
+    headers = [
+        "#",
+        "Question",
+        "Option",
+        "N",
+        "dof",
+        "&chi;&sup2;",
+        "p",
+        "p (FDR)",
+        "Cram&eacute;r's V",
+        "Min. expected",
+    ]
 
-    for i, (path, tab_name) in enumerate(file_info):
-        with open(path, "r", encoding="utf-8") as f:
-            html = f.read()
+    html = f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{escape(title)}</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; padding: 20px; }}
+        table.associations {{ border-collapse: collapse; }}
+        table.associations th, table.associations td {{ border: 1px solid #ccc; padding: 6px 10px; text-align: left; }}
+        table.associations th {{ background-color: #f2f2f2; }}
+        table.associations tr.significant {{ background-color: #e6f4ea; font-weight: bold; }}
+        table.associations tr.sparse td:last-child {{ color: #b00; }}
+    </style>
+</head>
+<body>
+    <h1>{escape(title)}</h1>
+    <p>Chi-square tests of independence between each question and the profile,
+    ranked by Benjamini-Hochberg adjusted p-value. Multiselect options are tested
+    one by one (selected or not). {significant} of {len(table)} tests are
+    significant at a false discovery rate of {alpha:g}. Expected counts below 5
+    (in red) make the p-value approximate.</p>
+    <table class="associations">
+        <tr>{"".join(f"<th>{header}</th>" for header in headers)}</tr>
+        {"".join(rows)}
+    </table>
+</body>
+</html>
+"""
+    Path(output_path).write_text(html, encoding="utf-8")
+    print(f"Association table saved to: {output_path}")
+    return output_path
 
-        # Extract styles from <style> or <link> tags
-        styles += re.findall(
-            r"<style.*?>.*?</style>", html, flags=re.DOTALL | re.IGNORECASE
-        )
-        styles += re.findall(
-            r'<link[^>]+rel=["\']stylesheet["\'][^>]*>', html, flags=re.IGNORECASE
-        )
 
-        # Extract body content
-        body_match = re.search(
-            r"<body[^>]*>(.*?)</body>", html, flags=re.DOTALL | re.IGNORECASE
-        )
-        body = body_match.group(1).strip() if body_match else html.strip()
+import hashlib
+import re
+from pathlib import Path
 
-        tab_id = f"tab{i}"
-        tab_ids.append((tab_name, tab_id))
-        contents.append((tab_id, body))
+from bs4 import BeautifulSoup
 
-    # Combined HTML template
-    combined_html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>Combined HTML with Tabs</title>
-    {"".join(styles)}
+_STYLE_PATTERN = re.compile(
+    r"<style\b.*?</style>|<link[^>]+rel=[\"']stylesheet[\"'][^>]*>",
+    flags=re.DOTALL | re.IGNORECASE,
+)
+_SCRIPT_PATTERN = re.compile(
+    r"<script\b[^>]*>.*?</script>", flags=re.DOTALL | re.IGNORECASE
+)
+_SCRIPT_TYPE = re.compile(r"\btype\s*=\s*[\"']?([^\"'\s>]*)", flags=re.IGNORECASE)
+_SCRIPT_SRC = re.compile(r"\bsrc\s*=\s*[\"']?([^\"'\s>]+)", flags=re.IGNORECASE)
+_JAVASCRIPT_TYPES = {
+    "",
+    "module",
+    "text/javascript",
+    "application/javascript",
+    "text/ecmascript",
+    "application/ecmascript",
+}
+
+_TABS_STYLE = """
     <style>
-        html, body {{
+        html, body {
             margin: 0;
             padding: 0;
             height: 100%;
             font-family: Arial, sans-serif;
-        }}
-        .tabbar {{
+        }
+        .tabbar {
             display: flex;
             background-color: #333;
-        }}
-        .tablink {{
+        }
+        .tablink {
             flex: 1;
             background-color: #333;
             color: white;
@@ -388,43 +2440,174 @@ def combine_html(file_info, output_path="combined_tabs.html"):
             padding: 14px 0;
             cursor: pointer;
             font-size: 16px;
-        }}
-        .tablink:hover {{
+        }
+        .tablink:hover {
             background-color: #575757;
-        }}
-        .tabcontent {{
+        }
+        .tabcontent {
             display: none;
             height: calc(100vh - 48px);
             overflow-y: auto;
             padding: 0;
             box-sizing: border-box;
-        }}
-        .tabcontent.active {{
+        }
+        .tabcontent.active {
             display: block !important;
-        }}
+        }
     </style>
-</head>
-<body>
-    <div class="tabbar">
-        {"".join(f'<button class="tablink" onclick="showTab(\'{tab_id}\')">{label}</button>' for label, tab_id in tab_ids)}
-    </div>
-    {"".join(f'<div id="{tab_id}" class="tabcontent{" active" if i == 0 else ""}">{content}</div>' for i, (tab_id, content) in enumerate(contents))}
+"""
+
+_TABS_SCRIPT = """
     <script>
-        function showTab(tabId) {{
+        function showTab(tabId) {
             var tabs = document.getElementsByClassName('tabcontent');
-            for (var i = 0; i < tabs.length; i++) {{
+            for (var i = 0; i < tabs.length; i++) {
                 tabs[i].classList.remove('active');
-            }}
-            document.getElementById(tabId).classList.add('active');
-        }}
+            }
+            var tab = document.getElementById(tabId);
+            // Lazy tabs: the body is parsed on first activation
+            var template = document.getElementById(tabId + '-body');
+            if (template) {
+                tab.appendChild(document.importNode(template.content, true));
+                template.remove();
+            }
+            tab.classList.add('active');
+        }
     </script>
-</body>
-</html>
 """
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(combined_html)
 
+def _split_html(html):
+    """Inner HTML of <head> and <body>; a fragment without <body> is all body."""
+    head = re.search(r"<head[^>]*>(.*?)</head>", html, flags=re.DOTALL | re.IGNORECASE)
+    body = re.search(r"<body[^>]*>(.*?)</body>", html, flags=re.DOTALL | re.IGNORECASE)
+    return (
+        head.group(1) if head else "",
+        body.group(1).strip() if body else html.strip(),
+    )
+
+
+def _script_src(tag):
+    """URL of an external script, None for inline code and for styles."""
+    if tag[:7].lower() != "<script":
+        return None
+    match = _SCRIPT_SRC.search(tag[: tag.index(">") + 1])
+    return match.group(1) if match else None
+
+
+def _is_javascript(tag):
+    """False for data blocks such as <script type="application/json">."""
+    match = _SCRIPT_TYPE.search(tag[: tag.index(">") + 1])
+    return (match.group(1).lower() if match else "") in _JAVASCRIPT_TYPES
+
+
+def _asset_key(tag):
+    """External scripts are the same asset when their URL is; the rest by content."""
+    src = _script_src(tag)
+    return f"src:{src}" if src else hashlib.sha256(tag.encode()).hexdigest()
+
+
+def combine_html(file_info, output_path="combined_tabs.html", lazy=False):
+    """
+    Combine multiple HTML files into one fullscreen tabbed HTML page, preserving styles.
+
+    Styles, stylesheet links and head scripts are moved to the page head
+    once each, identical copies being dropped by content hash. Body scripts
+    stay in their tab, except external scripts (shared once per URL) and
+    inline scripts found in two or more of the files (e.g. an inlined
+    plotly.js), which are moved to the head as well. Data blocks such as
+    <script type="application/json"> always stay where they are. The files
+    are read one at a time and the tab bodies are streamed to the output, so
+    only one input is in memory.
+
+    Parameters:
+    - file_info: List of tuples (filepath, tab_name)
+    - output_path: Path to save the combined HTML output
+    - lazy: Keep every tab but the first in a <template>, parsed (and its
+      scripts run) only when the tab is first opened
+    """
+    # Pass 1: candidate assets in order of first appearance, and how many
+    # files each inline body script is in
+    candidates = {}
+    occurrences = {}
+    shared = set()
+    files_with = {}
+    for path, _ in file_info:
+        with open(path, "r", encoding="utf-8") as f:
+            head, body = _split_html(f.read())
+        in_head = (
+            _STYLE_PATTERN.findall(head)
+            + _STYLE_PATTERN.findall(body)
+            + _SCRIPT_PATTERN.findall(head)
+        )
+        in_body = [s for s in _SCRIPT_PATTERN.findall(body) if _is_javascript(s)]
+        for tag in in_head + in_body:
+            key = _asset_key(tag)
+            candidates.setdefault(key, tag)
+            occurrences[key] = occurrences.get(key, 0) + 1
+        shared.update(_asset_key(tag) for tag in in_head)
+        shared.update(_asset_key(tag) for tag in in_body if _script_src(tag))
+        for key in {_asset_key(tag) for tag in in_body if not _script_src(tag)}:
+            files_with[key] = files_with.get(key, 0) + 1
+    shared.update(key for key, count in files_with.items() if count >= 2)
+    assets = {key: tag for key, tag in candidates.items() if key in shared}
+
+    def tab_body(match):
+        tag = match.group(0)
+        is_script = tag[:7].lower() == "<script"
+        if is_script and not _is_javascript(tag):
+            return tag
+        return "" if _asset_key(tag) in shared else tag
+
+    tab_ids = [
+        (escape(tab_name), f"tab{i}") for i, (_, tab_name) in enumerate(file_info)
+    ]
+
+    # Pass 2: stream the page
+    with open(output_path, "w", encoding="utf-8") as out:
+        out.write(
+            '<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="utf-8">\n'
+            "    <title>Combined HTML with Tabs</title>\n"
+        )
+        for tag in assets.values():
+            out.write(tag)
+            out.write("\n")
+        out.write(_TABS_STYLE)
+        out.write(_TABS_SCRIPT)
+        out.write('</head>\n<body>\n    <div class="tabbar">\n')
+        for label, tab_id in tab_ids:
+            out.write(
+                f'        <button class="tablink" onclick="showTab(\'{tab_id}\')">'
+                f"{label}</button>\n"
+            )
+        out.write("    </div>\n")
+
+        for i, ((path, _), (_, tab_id)) in enumerate(zip(file_info, tab_ids)):
+            with open(path, "r", encoding="utf-8") as f:
+                _, body = _split_html(f.read())
+            body = _SCRIPT_PATTERN.sub(tab_body, _STYLE_PATTERN.sub(tab_body, body))
+
+            if i == 0:
+                out.write(f'    <div id="{tab_id}" class="tabcontent active">')
+                out.write(body)
+                out.write("</div>\n")
+            elif lazy:
+                out.write(f'    <div id="{tab_id}" class="tabcontent"></div>\n')
+                out.write(f'    <template id="{tab_id}-body">')
+                out.write(body)
+                out.write("</template>\n")
+            else:
+                out.write(f'    <div id="{tab_id}" class="tabcontent">')
+                out.write(body)
+                out.write("</div>\n")
+
+        out.write("</body>\n</html>\n")
+
+    duplicates = sum(occurrences[key] for key in assets) - len(assets)
+    print(
+        f"Combined {len(file_info)} files into {output_path}: {len(assets)} shared "
+        f"styles and scripts, {duplicates} duplicates dropped"
+    )
     return output_path
 
 
@@ -433,43 +2616,273 @@ from pathlib import Path
 import plotly.io as pio
 
 
-def export_all_plots_combined_html(output_file="profile_distribution_report.html"):
-    html_blocks = []
+import json
 
-    for question in question_columns:
-        # Generate the figure
-        graph_component = create_percentage_distribution_plot(question)
-        fig = graph_component.figure
+import plotly.graph_objs as go
+from plotly.colors import qualitative
+from plotly.offline import get_plotlyjs
 
-        # Convert figure to HTML fragment (no full page wrapper)
-        html_fragment = pio.to_html(fig, include_plotlyjs=False, full_html=False)
-        html_blocks.append(f"<div style='margin-bottom:40px;'>{html_fragment}</div>")
+PLOTLY_CDN = "https://cdn.plot.ly/plotly-2.35.2.min.js"
 
-    # Wrap all fragments in full HTML document
-    full_html = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <title>Demographic Response Distributions</title>
-        <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }}
-            h1 {{
-                text-align: center;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Per-Profile Response Distributions (All Questions)</h1>
-        {"".join(html_blocks)}
-    </body>
-    </html>
+
+def figure_bundle(figures):
+    """
+    Packs plotly figures into one JSON-ready dict, moving the layout keys
+    that all figures share (template, axis titles, size...) into a single
+    layout so they are stored once.
+
+    Returns:
+        dict: {"layout": shared layout, "figures": [{"data", "layout"}, ...]}
+    """
+    specs = [json.loads(pio.to_json(fig, validate=False)) for fig in figures]
+    layouts = [spec.get("layout", {}) for spec in specs]
+    shared = {
+        key: value
+        for key, value in (layouts[0].items() if layouts else [])
+        if all(layout.get(key) == value for layout in layouts[1:])
+    }
+    return {
+        "layout": shared,
+        "figures": [
+            {
+                "data": spec.get("data", []),
+                "layout": {k: v for k, v in layout.items() if k not in shared},
+            }
+            for spec, layout in zip(specs, layouts)
+        ],
+    }
+
+
+def render_figures_html(
+    figures, title, header_html="", offline=True, lazy=True, height=450
+):
+    """
+    Renders plotly figures into one standalone HTML document.
+
+    The figures are stored as a single compact JSON blob with a shared
+    layout (see figure_bundle) and drawn client side. With offline=True
+    plotly.js is inlined once, so the report opens without network access;
+    otherwise it is loaded from the CDN. With lazy=True each figure is only
+    drawn when it scrolls into view (IntersectionObserver).
+
+    Args:
+        figures (list): plotly.graph_objs.Figure objects, in page order.
+        title (str): Page title and heading.
+        header_html (str): Trusted HTML inserted above the figures.
+        offline (bool): Inline plotly.js instead of linking the CDN.
+        lazy (bool): Draw figures as they become visible.
+        height (int): Placeholder height in pixels before a figure is drawn.
+
+    Returns:
+        str: The HTML document.
+    """
+    bundle = json.dumps(figure_bundle(figures), separators=(",", ":"))
+    # Keep "</script>" and friends out of the inline JSON
+    bundle = bundle.replace("<", "\\u003c")
+
+    if offline:
+        plotly_script = f"<script>{get_plotlyjs()}</script>"
+    else:
+        plotly_script = f'<script src="{PLOTLY_CDN}"></script>'
+
+    # The loader finds its container by an ID derived from the figures, so
+    # its code differs between reports and combine_html keeps it in its tab
+    container_id = "figures-" + hashlib.sha256(bundle.encode()).hexdigest()[:12]
+
+    placeholders = "\n".join(
+        f'<div class="figure" data-figure="{i}" style="min-height:{height}px"></div>'
+        for i in range(len(figures))
+    )
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>{title}</title>
+{plotly_script}
+<style>
+    body {{ font-family: Arial, sans-serif; margin: 20px; }}
+    h1 {{ text-align: center; }}
+    .figure {{ margin-bottom: 40px; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{header_html}
+<div class="figures" id="{container_id}">
+{placeholders}
+<script type="application/json">{bundle}</script>
+<script>
+(function () {{
+    // Scoped to its own container, so several reports can share a page
+    // (see combine_html)
+    var root = document.getElementById("{container_id}");
+    var data = root.querySelector("script[type='application/json']");
+    var bundle = JSON.parse(data.textContent);
+    function draw(el) {{
+        var fig = bundle.figures[+el.dataset.figure];
+        var layout = Object.assign({{}}, bundle.layout, fig.layout);
+        Plotly.newPlot(el, fig.data, layout, {{responsive: true}});
+    }}
+    var targets = root.querySelectorAll(".figure");
+    if ({str(lazy).lower()} && "IntersectionObserver" in window) {{
+        var observer = new IntersectionObserver(function (entries) {{
+            entries.forEach(function (entry) {{
+                if (entry.isIntersecting) {{
+                    observer.unobserve(entry.target);
+                    draw(entry.target);
+                }}
+            }});
+        }}, {{rootMargin: "200px"}});
+        targets.forEach(function (el) {{ observer.observe(el); }});
+    }} else {{
+        targets.forEach(draw);
+    }}
+}})();
+</script>
+</div>
+</body>
+</html>
+"""
+
+
+def profile_color_map(profiles):
+    """Consistent plotly colors for the profiles, in the given order."""
+    return {profile: color for profile, color in zip(profiles, qualitative.Plotly)}
+
+
+def profile_distribution_figure(
+    question_cube, question, profiles, color_map, showlegend=True
+):
+    """
+    Grouped bar chart of the answers to one question, as percentages within
+    each profile, from the question's rows of the crosstab cube. With the
+    resample_crosstab columns in the cube, bars get their confidence interval
+    as error bars and the permutation p-value on hover.
+    """
+    # Percentages per option (rows) and profile (columns), zeros included
+    counts = question_cube.pivot(
+        index="option", columns="profile", values="percentage"
+    ).reindex(columns=profiles, fill_value=0)
+    # Options nobody chose are not plotted
+    counts = counts[counts.sum(axis=1) > 0].sort_index()
+    all_options = counts.index.tolist()
+
+    uncertainty = {}
+    if "ci_low" in question_cube:
+        uncertainty = {
+            col: question_cube.pivot(
+                index="option", columns="profile", values=col
+            ).reindex(index=counts.index, columns=profiles)
+            for col in ("ci_low", "ci_high", "p_value")
+        }
+
+    def error_bars(profile):
+        if not uncertainty:
+            return {}
+        return {
+            "error_y": dict(
+                type="data",
+                symmetric=False,
+                array=(uncertainty["ci_high"][profile] - counts[profile]).tolist(),
+                arrayminus=(counts[profile] - uncertainty["ci_low"][profile]).tolist(),
+                thickness=1,
+            ),
+            "customdata": uncertainty["p_value"][profile].tolist(),
+            "hovertemplate": "%{x}: %{y:.1f}% (p = %{customdata:.3g})",
+        }
+
+    bars = [
+        go.Bar(
+            x=all_options,
+            y=counts[profile].tolist(),
+            name=profile,
+            marker_color=color_map[profile],
+            showlegend=showlegend,
+            **error_bars(profile),
+        )
+        for profile in profiles
+    ]
+
+    return go.Figure(
+        data=bars,
+        layout=go.Layout(
+            title=f"Response Distribution to '{question}' (by Profile)",
+            xaxis_title="Answer Option",
+            yaxis_title="Percentage within Profile",
+            barmode="group",
+            height=450,
+        ),
+    )
+
+
+def export_all_plots_combined_html(
+    cube,
+    question_columns,
+    output_file="reports/profile_distribution_report.html",
+    offline=True,
+    lazy=True,
+):
+    """
+    Writes one chart per question, plus a summary of the profiles, into a
+    single HTML report. By default plotly.js is inlined once (the report
+    opens offline) and charts are drawn as they scroll into view; see
+    render_figures_html.
+
+    Args:
+        cube (pd.DataFrame): Crosstab cube (build_crosstab_cube).
+        question_columns (list): Questions to plot, in page order.
+        output_file (str): Path of the HTML report.
+        offline (bool): Inline plotly.js instead of linking the CDN.
+        lazy (bool): Draw charts as they become visible.
+
+    Returns:
+        str: output_file
+    """
+    profiles = cube["profile"].unique().tolist()
+    color_map = profile_color_map(profiles)
+
+    # --- Summary block ---
+    profile_counts = (
+        cube.drop_duplicates("profile")
+        .set_index("profile")["visitors"]
+        .sort_values(ascending=False)
+        .to_dict()
+    )
+    total_visitors = sum(profile_counts.values())
+    profile_items = "".join(
+        f"<li><strong>{escape(profile)}</strong>: {count} visitors</li>"
+        for profile, count in profile_counts.items()
+    )
+    summary_html = f"""
+    <div style="margin-bottom: 30px;">
+        <h2>Survey Overview</h2>
+        <p><strong>Total Visitors:</strong> {total_visitors}</p>
+        <ul>{profile_items}</ul>
+    </div>
     """
 
-    # Write to file
+    # --- Generate charts ---
+    figures = [
+        profile_distribution_figure(
+            cube[cube["question"] == question],
+            question,
+            profiles,
+            color_map,
+            showlegend=(question == question_columns[0]),
+        )
+        for question in question_columns
+    ]
+
+    # --- Combine all into full HTML document ---
+    full_html = render_figures_html(
+        figures,
+        "Per-Profile Response Distributions (All Questions)",
+        header_html=summary_html,
+        offline=offline,
+        lazy=lazy,
+    )
+
     Path(output_file).write_text(full_html, encoding="utf-8")
-    print(f"✅ Combined interactive HTML report saved to: {output_file}")
+    print(f"Combined interactive HTML report saved to: {output_file}")
+    return output_file